@@ -0,0 +1,87 @@
+import gzip
+import json
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+try:
+    import brotli
+except ImportError:  # optional: only used when installed
+    brotli = None
+
+from .live import base_series
+
+MIN_COMPRESS_BYTES = 512
+
+
+def lttb(values: Sequence[float], threshold: int) -> List[int]:
+    # Largest-Triangle-Three-Buckets: keeps first/last points and, for every
+    # bucket in between, the point forming the largest triangle with its
+    # neighbours, which preserves peaks and valleys of the series.
+    size = len(values)
+    if threshold >= size or threshold < 3:
+        return list(range(size))
+
+    selected = [0]
+    bucket_size = (size - 2) / (threshold - 2)
+    anchor = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+        next_start = end
+        next_end = min(int((bucket + 2) * bucket_size) + 1, size)
+        if next_start >= next_end:
+            next_start, next_end = size - 1, size
+        avg_x = (next_start + next_end - 1) / 2
+        avg_y = sum(values[next_start:next_end]) / (next_end - next_start)
+
+        best_index, best_area = start, -1.0
+        anchor_y = values[anchor]
+        for index in range(start, min(end, size - 1)):
+            area = abs((anchor - avg_x) * (values[index] - anchor_y) - (anchor - index) * (avg_y - anchor_y))
+            if area > best_area:
+                best_index, best_area = index, area
+        selected.append(best_index)
+        anchor = best_index
+    selected.append(size - 1)
+    return selected
+
+
+def compact_chart(
+    rows,
+    names: Dict[str, str],
+    hidden_keys: Optional[Set[str]] = None,
+    points: Optional[int] = None,
+) -> dict:
+    series = base_series(rows)
+    for key in hidden_keys or ():
+        series.pop(key, None)
+
+    # All series share one x axis; indices are picked from the consolidated
+    # total so its shape survives the downsampling.
+    indices = lttb(series["total"], points) if points else list(range(len(rows)))
+    payload = {
+        "labels": [rows[index]["date"].isoformat() for index in indices],
+        "names": {key: names.get(key, key) for key in series},
+        "series": {key: [round(values[index], 2) for index in indices] for key, values in series.items()},
+    }
+    if len(indices) != len(rows):
+        payload["index"] = indices
+    return payload
+
+
+def accepted_encoding(accept_encoding: str) -> Optional[str]:
+    offered = {part.split(";")[0].strip() for part in accept_encoding.lower().split(",")}
+    if brotli is not None and "br" in offered:
+        return "br"
+    if "gzip" in offered:
+        return "gzip"
+    return None
+
+
+def encode_json(payload, accept_encoding: str) -> Tuple[bytes, Optional[str]]:
+    body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    encoding = accepted_encoding(accept_encoding) if len(body) >= MIN_COMPRESS_BYTES else None
+    if encoding == "br":
+        body = brotli.compress(body)
+    elif encoding == "gzip":
+        body = gzip.compress(body, compresslevel=6)
+    return body, encoding
@@ -0,0 +1,73 @@
+import csv
+import io
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+FLUSH_EVERY_ROWS = 256
+
+
+def projection_rows(
+    steps, accounts, vale_labels: Dict[str, str], selected_ids: Optional[Set[int]] = None
+) -> Iterator[List]:
+    columns = [acc for acc in accounts if selected_ids is None or acc.id in selected_ids]
+    vale_keys: Optional[List[str]] = None
+    for row, _ in steps:
+        if vale_keys is None:
+            vale_keys = list(row["vales"].keys())
+            yield (
+                ["data"]
+                + [acc.name for acc in columns]
+                + [vale_labels.get(key, key) for key in vale_keys]
+                + ["Cartão (dívida)", "Total (sem vales)"]
+            )
+        account_values = [row["accounts"].get(acc.id, 0.0) for acc in columns]
+        yield (
+            [row["date"].isoformat()]
+            + [f"{value:.2f}" for value in account_values]
+            + [f"{row['vales'][key]:.2f}" for key in vale_keys]
+            + [f"{row['credit_card']:.2f}", f"{sum(account_values) + row['credit_card']:.2f}"]
+        )
+
+
+def event_rows(steps, selected_ids: Optional[Set[int]] = None) -> Iterator[List]:
+    yield ["data", "descricao", "valor", "destino", "conta_id"]
+    for _, day_events in steps:
+        for day, description, amount, target, account_id in day_events:
+            if selected_ids is not None and account_id not in selected_ids:
+                continue
+            yield [day.isoformat(), description, f"{amount:.2f}", target, "" if account_id is None else account_id]
+
+
+def stream_csv(rows: Iterable[List], compress: bool = False) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # wbits=31 makes zlib emit a gzip header/trailer instead of a raw zlib stream.
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def drain() -> bytes:
+        chunk = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate(0)
+        return compressor.compress(chunk) if compressor else chunk
+
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= FLUSH_EVERY_ROWS:
+            pending = 0
+            chunk = drain()
+            if chunk:
+                yield chunk
+
+    chunk = drain()
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
+
+
+def download_headers(filename: str, compress: bool) -> Dict[str, str]:
+    if compress:
+        filename += ".gz"
+    return {"Content-Disposition": f'attachment; filename="{filename}"'}
@@ -0,0 +1,117 @@
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from .models import Account, BalanceRollup, BalanceSnapshot, CreditCard, ValeBalance
+
+ROLLUP_PERIODS = ("month", "year")
+
+
+def period_start(day: date, period: str) -> date:
+    if period == "year":
+        return date(day.year, 1, 1)
+    return date(day.year, day.month, 1)
+
+
+def current_balances(db_session) -> Dict[str, float]:
+    balances = {f"account:{acc.id}": acc.balance for acc in db_session.query(Account).all()}
+    for vale in db_session.query(ValeBalance).all():
+        balances[f"vale:{vale.vale_type}"] = vale.balance
+    for card in db_session.query(CreditCard).all():
+        balances[f"credit_card:{card.id}"] = card.open_amount
+    return balances
+
+
+def record_balance(db_session, target: str, balance: float, day: Optional[date] = None) -> None:
+    # Snapshots are append-only; the rollups are folded forward here so range
+    # queries never have to scan the raw table. Callers own the commit.
+    day = day or date.today()
+    balance = balance or 0.0
+    db_session.add(BalanceSnapshot(target=target, day=day, balance=balance, recorded_at=datetime.now()))
+
+    # One upsert per rollup: the warmer thread and request handlers can record
+    # the same target concurrently, and a SELECT-then-INSERT would race on the
+    # (target, period, period_start) unique constraint.
+    for period in ROLLUP_PERIODS:
+        stmt = sqlite_insert(BalanceRollup).values(
+            target=target,
+            period=period,
+            period_start=period_start(day, period),
+            first_balance=balance,
+            last_balance=balance,
+            min_balance=balance,
+            max_balance=balance,
+            balance_sum=balance,
+            samples=1,
+        )
+        db_session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["target", "period", "period_start"],
+                set_={
+                    "last_balance": stmt.excluded.last_balance,
+                    "min_balance": func.min(BalanceRollup.min_balance, stmt.excluded.min_balance),
+                    "max_balance": func.max(BalanceRollup.max_balance, stmt.excluded.max_balance),
+                    "balance_sum": BalanceRollup.balance_sum + stmt.excluded.balance_sum,
+                    "samples": BalanceRollup.samples + 1,
+                },
+            )
+        )
+
+def record_daily_snapshots(db_session, day: Optional[date] = None) -> int:
+    day = day or date.today()
+    seen = {
+        target
+        for (target,) in db_session.query(BalanceSnapshot.target).filter(BalanceSnapshot.day == day).distinct()
+    }
+    recorded = 0
+    for target, balance in current_balances(db_session).items():
+        if target not in seen:
+            record_balance(db_session, target, balance, day)
+            recorded += 1
+    return recorded
+
+
+def balance_history(
+    db_session, target: str, start_date: date, end_date: date, granularity: str = "month"
+) -> List[dict]:
+    if granularity == "day":
+        snapshots = (
+            db_session.query(BalanceSnapshot)
+            .filter(
+                BalanceSnapshot.target == target,
+                BalanceSnapshot.day >= start_date,
+                BalanceSnapshot.day <= end_date,
+            )
+            .order_by(BalanceSnapshot.day, BalanceSnapshot.id)
+            .all()
+        )
+        by_day: Dict[date, float] = {}
+        for snap in snapshots:
+            by_day[snap.day] = snap.balance
+        return [{"period_start": day.isoformat(), "last": balance} for day, balance in by_day.items()]
+
+    rollups = (
+        db_session.query(BalanceRollup)
+        .filter(
+            BalanceRollup.target == target,
+            BalanceRollup.period == granularity,
+            BalanceRollup.period_start >= period_start(start_date, granularity),
+            BalanceRollup.period_start <= end_date,
+        )
+        .order_by(BalanceRollup.period_start)
+        .all()
+    )
+    return [
+        {
+            "period_start": rollup.period_start.isoformat(),
+            "first": rollup.first_balance,
+            "last": rollup.last_balance,
+            "min": rollup.min_balance,
+            "max": rollup.max_balance,
+            "average": rollup.balance_sum / rollup.samples if rollup.samples else None,
+            "samples": rollup.samples,
+        }
+        for rollup in rollups
+    ]
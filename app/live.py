@@ -0,0 +1,110 @@
+import asyncio
+import json
+from datetime import date
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+KEEPALIVE_SECONDS = 15.0
+MAX_SHARED_WINDOWS = 16
+
+Series = Dict[str, List[float]]
+
+
+def base_series(rows) -> Series:
+    series: Series = {"total": [], "vale_total": []}
+    for row in rows:
+        for acc_id, balance in row["accounts"].items():
+            series.setdefault(f"account:{acc_id}", []).append(balance)
+        for vale_key, balance in row["vales"].items():
+            series.setdefault(f"vale:{vale_key}", []).append(balance)
+        series["total"].append(sum(row["accounts"].values()) + row["credit_card"])
+        series["vale_total"].append(sum(row["vales"].values()))
+    return series
+
+
+def series_delta(previous: Series, current: Series) -> Optional[dict]:
+    # Only the suffix starting at the first changed day is sent for each
+    # series; a change in the set of series means the page needs a reload.
+    if previous.keys() != current.keys():
+        return None
+    delta = {}
+    for key, values in current.items():
+        old = previous[key]
+        start = next(
+            (index for index, (before, after) in enumerate(zip(old, values)) if before != after),
+            min(len(old), len(values)),
+        )
+        if start < len(values) or len(old) != len(values):
+            delta[key] = {"from": start, "values": values[start:]}
+    return delta
+
+
+def sse_message(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class LiveUpdates:
+    def __init__(self):
+        self.version = 0
+        self._changed = asyncio.Event()
+        self._series: Dict[Tuple[int, date, int], asyncio.Future] = {}
+
+    def publish(self) -> None:
+        self.version += 1
+        self._changed.set()
+        self._changed = asyncio.Event()
+        self._series = {key: value for key, value in self._series.items() if key[0] == self.version}
+
+    async def wait(self, version: int, timeout: float) -> bool:
+        if self.version != version:
+            return True
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def series(self, start_date: date, days: int, compute: Callable[[date, int], Series]) -> Series:
+        # Every open dashboard on the same window shares one recompute per version.
+        key = (self.version, start_date, days)
+        future = self._series.get(key)
+        if future is None:
+            future = asyncio.ensure_future(asyncio.to_thread(compute, start_date, days))
+            future.add_done_callback(lambda done: self._forget_failed(key, done))
+            self._series[key] = future
+            # Windows are client-chosen; keep only the most recent ones shared.
+            while len(self._series) > MAX_SHARED_WINDOWS:
+                self._series.pop(next(iter(self._series)))
+        return await asyncio.shield(future)
+
+    def _forget_failed(self, key: Tuple[int, date, int], future: asyncio.Future) -> None:
+        # A failed recompute must not be served again for the rest of the version.
+        if (future.cancelled() or future.exception() is not None) and self._series.get(key) is future:
+            del self._series[key]
+
+    async def stream(
+        self,
+        start_date: date,
+        days: int,
+        client_version: int,
+        compute: Callable[[date, int], Series],
+        is_disconnected: Callable[[], Awaitable[bool]],
+    ):
+        version = self.version
+        current = await self.series(start_date, days, compute)
+        if client_version != version:
+            yield sse_message("reset", {"version": version, "series": current})
+        yield sse_message("ready", {"version": version})
+
+        while not await is_disconnected():
+            if not await self.wait(version, KEEPALIVE_SECONDS):
+                yield ": keepalive\n\n"
+                continue
+            version = self.version
+            latest = await self.series(start_date, days, compute)
+            delta = series_delta(current, latest)
+            if delta is None:
+                yield sse_message("reload", {"version": version})
+                return
+            if delta:
+                yield sse_message("delta", {"version": version, "series": delta})
+            current = latest
@@ -0,0 +1,233 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+import httpx
+
+READ_WEIGHTS = {"simulate": 3, "dashboard": 3}
+WRITE_WEIGHTS = {"transactions": 2, "transfers": 1, "salary": 1}
+SIMULATE_DAYS = (30, 60, 90, 180)
+LOCK_MARKERS = ("database is locked", "database table is locked")
+
+
+class RouteStats:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.requests = 0
+        self.errors = 0
+        self.lock_errors = 0
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+        return ordered[index] * 1000
+
+
+class LoadGenerator:
+    def __init__(self, client: httpx.AsyncClient, write_ratio: float, seed: int, households: Optional[Dict[str, str]] = None):
+        self.client = client
+        self.write_ratio = write_ratio
+        self.random = random.Random(seed)
+        self.stats: Dict[str, RouteStats] = defaultdict(RouteStats)
+        self.tokens = households or {}
+        self.households: List[Optional[str]] = list(self.tokens) or [None]
+        self.account_ids: Dict[Optional[str], List[int]] = {}
+
+    def headers_for(self, household: Optional[str]) -> Dict[str, str]:
+        return {"X-Household": household, "X-Household-Token": self.tokens[household]} if household else {}
+
+    async def discover_accounts(self, household: Optional[str]) -> None:
+        headers = self.headers_for(household)
+        response = await self.client.get("/api/dashboard/chart", headers=headers)
+        names = response.json().get("names", {})
+        self.account_ids[household] = [int(key.split(":")[1]) for key in names if key.startswith("account:")]
+        if len(self.account_ids[household]) < 2:
+            await self.client.post("/account/caixinha", data={"name": "Carga", "balance": "100"}, headers=headers)
+            await self.discover_accounts(household)
+
+    def pick(self, weights: Dict[str, int]) -> str:
+        return self.random.choices(list(weights), weights=list(weights.values()))[0]
+
+    def request_for(self, route: str, account_ids: List[int]):
+        today = date.today()
+        if route == "simulate":
+            return "GET", "/simulate", {"params": {"days": self.random.choice(SIMULATE_DAYS)}}
+        if route == "dashboard":
+            end = today + timedelta(days=self.random.randint(7, 365))
+            return "GET", "/dashboard", {"params": {"start_date": today.isoformat(), "end_date": end.isoformat()}}
+        when = (today + timedelta(days=self.random.randint(0, 90))).isoformat()
+        if route == "transactions":
+            form = {
+                "description": "carga",
+                "amount": f"{self.random.uniform(1, 200):.2f}",
+                "date_start": when,
+                "target_type": "account",
+                "account_id": str(self.random.choice(account_ids)),
+            }
+            return "POST", "/transactions", {"data": form}
+        if route == "transfers":
+            from_id, to_id = self.random.sample(account_ids, 2)
+            form = {
+                "description": "carga",
+                "amount": f"{self.random.uniform(1, 50):.2f}",
+                "date_start": when,
+                "from_account_id": str(from_id),
+                "to_account_id": str(to_id),
+            }
+            return "POST", "/transfers", {"data": form}
+        form = {"amount": f"{self.random.uniform(3000, 9000):.2f}", "payday": str(self.random.randint(1, 28))}
+        return "POST", "/salary", {"data": form}
+
+    async def hit(self, route: str) -> None:
+        household = self.random.choice(self.households)
+        method, path, kwargs = self.request_for(route, self.account_ids[household])
+        kwargs["headers"] = self.headers_for(household)
+        stats = self.stats[f"{method} {path}"]
+        stats.requests += 1
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, **kwargs)
+        except Exception as exc:  # in-process mode surfaces server errors as exceptions
+            stats.errors += 1
+            if any(marker in str(exc) for marker in LOCK_MARKERS):
+                stats.lock_errors += 1
+            return
+        stats.latencies.append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            stats.errors += 1
+            if any(marker in response.text for marker in LOCK_MARKERS):
+                stats.lock_errors += 1
+
+    async def worker(self, deadline: float, remaining: List[int]) -> None:
+        while time.perf_counter() < deadline and remaining[0] != 0:
+            remaining[0] -= 1
+            is_write = self.random.random() < self.write_ratio
+            await self.hit(self.pick(WRITE_WEIGHTS if is_write else READ_WEIGHTS))
+
+    async def run(self, concurrency: int, duration: float, requests: int) -> float:
+        for household in self.households:
+            await self.discover_accounts(household)
+        remaining = [requests if requests > 0 else -1]
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(self.worker(deadline, remaining) for _ in range(concurrency)))
+        return time.perf_counter() - started
+
+    def report(self, elapsed: float) -> dict:
+        routes = {}
+        for name, stats in sorted(self.stats.items()):
+            routes[name] = {
+                "requests": stats.requests,
+                "errors": stats.errors,
+                "lock_errors": stats.lock_errors,
+                "rps": round(len(stats.latencies) / elapsed, 2) if elapsed else None,
+                "p50_ms": stats.percentile(0.50),
+                "p95_ms": stats.percentile(0.95),
+                "p99_ms": stats.percentile(0.99),
+            }
+        total = sum(len(stats.latencies) for stats in self.stats.values())
+        return {
+            "elapsed_s": round(elapsed, 2),
+            "throughput_rps": round(total / elapsed, 2) if elapsed else None,
+            "lock_errors": sum(stats.lock_errors for stats in self.stats.values()),
+            "routes": routes,
+        }
+
+
+def print_report(report: dict) -> None:
+    def ms(value):
+        return "-" if value is None else f"{value:8.1f}"
+
+    print(f"{'rota':<20} {'req':>6} {'err':>5} {'lock':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, route in report["routes"].items():
+        print(
+            f"{name:<20} {route['requests']:>6} {route['errors']:>5} {route['lock_errors']:>5} "
+            f"{route['rps']:>8} {ms(route['p50_ms'])} {ms(route['p95_ms'])} {ms(route['p99_ms'])}"
+        )
+    print(
+        f"total: {report['throughput_rps']} req/s em {report['elapsed_s']}s, "
+        f"{report['lock_errors']} erro(s) de lock do SQLite"
+    )
+
+
+def household_names(count: int) -> List[str]:
+    return [f"carga-{number}" for number in range(1, count + 1)]
+
+
+def parse_households(values: List[str]) -> Dict[str, str]:
+    households = {}
+    for value in values:
+        household, _, token = value.partition(":")
+        if not token:
+            raise SystemExit(f"--household espera id:token, recebeu {value!r}")
+        households[household] = token
+    return households
+
+
+async def run_in_process(args) -> dict:
+    # The app reads its storage locations at import time, so point it at a scratch copy
+    # of the database before importing it.
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    database = os.path.join(workdir, "data.db")
+    if args.database and os.path.exists(args.database):
+        shutil.copy(args.database, database)
+    os.environ["DATABASE_URL"] = f"sqlite:///{database}"
+    os.environ["HOUSEHOLD_DATA_DIR"] = os.path.join(workdir, "households")
+    try:
+        from .main import app, shards
+
+        households = {household: shards.create(household) for household in household_names(args.households)}
+
+        transport = httpx.ASGITransport(app=app)
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+                generator = LoadGenerator(client, args.write_ratio, args.seed, households)
+                elapsed = await generator.run(args.concurrency, args.duration, args.requests)
+        return generator.report(elapsed)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+async def run_remote(args) -> dict:
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+        generator = LoadGenerator(client, args.write_ratio, args.seed, parse_households(args.household))
+        elapsed = await generator.run(args.concurrency, args.duration, args.requests)
+    return generator.report(elapsed)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Gera carga mista contra o app e mede latências.")
+    parser.add_argument("--url", help="servidor já em execução (ex.: http://127.0.0.1:8000); sem ele roda in-process")
+    parser.add_argument("--database", default="data.db", help="banco copiado para o modo in-process (padrão: data.db)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0, help="segundos de carga")
+    parser.add_argument("--requests", type=int, default=0, help="para após N requisições (0 = só pelo tempo)")
+    parser.add_argument("--write-ratio", type=float, default=0.2, help="fração de POSTs na mistura")
+    parser.add_argument("--households", type=int, default=0, help="in-process: cria N residências carga-1..carga-N e espalha a carga por elas")
+    parser.add_argument("--household", action="append", default=[], metavar="ID:TOKEN", help="--url: residência já criada (repetível)")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="imprime o relatório em JSON")
+    args = parser.parse_args(argv)
+    if args.url and args.households:
+        parser.error("--households cria residências locais; com --url use --household id:token")
+
+    report = asyncio.run(run_remote(args) if args.url else run_in_process(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
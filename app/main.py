@@ -1,28 +1,139 @@
+import asyncio
+import hashlib
+import hmac
 import json
+import os
+import secrets
+from contextlib import asynccontextmanager, suppress
 from datetime import date, datetime, timedelta
-from typing import List, Optional
+from functools import partial
+from typing import Dict, List, Optional
 
-from fastapi import Depends, FastAPI, Form, Query, Request
-from fastapi.responses import RedirectResponse
+from fastapi import Depends, FastAPI, Form, HTTPException, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import Session
 
-from .db import Base, engine, SessionLocal
-from .models import Account, CreditCard, Salary, Transaction, Transfer, ValeBalance
-from .simulation import ensure_defaults, simulate
+from . import operations
+from .charts import compact_chart, encode_json
+from .export import download_headers, event_rows, projection_rows, stream_csv
+from .history import balance_history
+from .live import LiveUpdates, base_series
+from .models import Account, CreditCard, Salary, Scenario, Transaction, Transfer, ValeBalance
+from .precompute import ProjectionWarmer
+from .scenarios import compare_scenarios, run_base
+from .schemas import BatchRequest
+from .simulation import ensure_defaults, iter_simulation, simulate
+from .storage import DEFAULT_HOUSEHOLD, ShardManager, household_signature, valid_household
 from .utils import expand_date_ranges
 
-Base.metadata.create_all(bind=engine)
+MAX_EXPORT_DAYS = 3650
+MAX_DAILY_HISTORY_DAYS = 366
+BOOT_TOKEN = secrets.token_hex(4)
+HOUSEHOLD_HEADER = "X-Household"
+HOUSEHOLD_TOKEN_HEADER = "X-Household-Token"
+HOUSEHOLD_COOKIE = "household"
+# Without a configured secret, household cookies last until the next restart.
+HOUSEHOLD_COOKIE_SECRET = os.environ.get("HOUSEHOLD_COOKIE_SECRET") or secrets.token_hex(32)
 
-app = FastAPI(title="Tracking Spending")
+warmers: Dict[str, ProjectionWarmer] = {}
+channels: Dict[str, LiveUpdates] = {}
+
+
+def drop_warmer(household: str) -> None:
+    # Cached projections of an evicted shard go with its engine.
+    warmer = warmers.pop(household, None)
+    if warmer is not None:
+        warmer.cancel()
+
+
+shards = ShardManager(on_evict=drop_warmer)
+
+
+def in_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def warmer_for(household: str) -> ProjectionWarmer:
+    warmer = warmers.get(household)
+    if warmer is None:
+        warmer = warmers[household] = ProjectionWarmer(partial(shards.session, household))
+    if not warmer.started and in_event_loop():
+        warmer.start()
+    return warmer
+
+
+def live_for(household: str) -> LiveUpdates:
+    channel = channels.get(household)
+    if channel is None:
+        channel = channels[household] = LiveUpdates()
+    return channel
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    shards.shard(DEFAULT_HOUSEHOLD)
+    warmer_for(DEFAULT_HOUSEHOLD)
+    yield
+    for warmer in list(warmers.values()):
+        await warmer.stop()
+    warmers.clear()
+    shards.close_all()
+
+
+app = FastAPI(title="Tracking Spending", lifespan=lifespan)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 templates.env.filters["brl"] = lambda value: "R$ " + f"{value:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
 
 
-def get_db():
-    db = SessionLocal()
+@app.exception_handler(OperationalError)
+async def sqlite_locked(request: Request, exc: OperationalError):
+    # Lock waits that time out are load, not bugs: answer 503 with a body the
+    # load test (and clients) can recognise instead of a bare 500.
+    if "is locked" not in str(exc):
+        raise exc
+    return JSONResponse({"detail": "database is locked"}, status_code=503, headers={"Retry-After": "1"})
+
+
+def cookie_household(value: str) -> Optional[str]:
+    household, _, signature = value.rpartition(".")
+    if not valid_household(household):
+        return None
+    token_hash = shards.access_hash(household)
+    if token_hash is None:
+        return None
+    expected = household_signature(HOUSEHOLD_COOKIE_SECRET, household, token_hash)
+    return household if hmac.compare_digest(expected, signature) else None
+
+
+def get_household(request: Request) -> str:
+    # API clients send X-Household with X-Household-Token; browsers carry the
+    # signed cookie set by POST /household. Unknown households and wrong
+    # tokens get the same answer.
+    household = request.headers.get(HOUSEHOLD_HEADER)
+    if household is not None:
+        token = request.headers.get(HOUSEHOLD_TOKEN_HEADER, "")
+        if not valid_household(household) or not shards.check_token(household, token):
+            raise HTTPException(status_code=401, detail="Credenciais da residência inválidas.")
+        return household
+    household = cookie_household(request.cookies.get(HOUSEHOLD_COOKIE, ""))
+    if household:
+        return household
+    if shards.access_hash(DEFAULT_HOUSEHOLD) is None:
+        return DEFAULT_HOUSEHOLD  # single-household install: no token was ever issued
+    raise HTTPException(status_code=401, detail="Entre em uma residência em /household.")
+
+
+def get_db(household: str = Depends(get_household)):
+    db = shards.session(household)
     try:
         ensure_defaults(db)
         yield db
@@ -30,12 +141,71 @@ def get_db():
         db.close()
 
 
+def commit_changes(db: Session) -> None:
+    household = db.info["household"]
+    db.commit()
+    warmer_for(household).invalidate()
+    live_for(household).publish()
+
+
+def cached_simulation(db: Session, start_date: date, days: int):
+    warmer = warmer_for(db.info["household"])
+    cached = warmer.get(start_date, days)
+    if cached is not None:
+        return cached
+    generation = warmer.generation
+    result = simulate(db, start_date, days)
+    warmer.store(generation, start_date, days, result)
+    return result
+
+
+async def scenario_comparison_for(db: Session, start_date: date, days: int):
+    scenarios = db.query(Scenario).order_by(Scenario.id).all()
+    if not scenarios:
+        return scenarios, None
+    warmer = warmer_for(db.info["household"])
+    base = warmer.get_base_run(start_date, days)
+    if base is None:
+        generation = warmer.generation
+        base = await asyncio.to_thread(run_base, db, start_date, days)
+        warmer.store_base_run(generation, start_date, days, base)
+    return scenarios, await compare_scenarios(scenarios, base)
+
+
+@app.get("/household")
+async def household_page(request: Request):
+    current = cookie_household(request.cookies.get(HOUSEHOLD_COOKIE, ""))
+    return templates.TemplateResponse("household.html", {"request": request, "current": current, "error": None})
+
+
+@app.post("/household")
+async def household_login(request: Request, household: str = Form(...), token: str = Form(...)):
+    household = household.strip().lower()
+    if not valid_household(household) or not shards.check_token(household, token.strip()):
+        return templates.TemplateResponse(
+            "household.html",
+            {"request": request, "current": None, "error": "Residência ou token inválidos."},
+            status_code=401,
+        )
+    signature = household_signature(HOUSEHOLD_COOKIE_SECRET, household, shards.access_hash(household))
+    response = RedirectResponse("/", status_code=303)
+    response.set_cookie(HOUSEHOLD_COOKIE, f"{household}.{signature}", httponly=True, samesite="lax")
+    return response
+
+
+@app.post("/household/logout")
+async def household_logout():
+    response = RedirectResponse("/household", status_code=303)
+    response.delete_cookie(HOUSEHOLD_COOKIE)
+    return response
+
+
 @app.get("/")
 async def read_root(request: Request, db: Session = Depends(get_db)):
     accounts = db.query(Account).all()
-    card = db.query(CreditCard).first()
+    cards = db.query(CreditCard).order_by(CreditCard.id).all()
     salary = db.query(Salary).first()
-    vales = db.query(ValeBalance).all()
+    vales = db.query(ValeBalance).order_by(ValeBalance.id).all()
     caixinhas = [acc for acc in accounts if acc.type == "caixinha"]
     corrente = next((acc for acc in accounts if acc.type == "corrente"), None)
     return templates.TemplateResponse(
@@ -45,7 +215,7 @@ async def read_root(request: Request, db: Session = Depends(get_db)):
             "accounts": accounts,
             "caixinhas": caixinhas,
             "corrente": corrente,
-            "card": card,
+            "cards": cards,
             "salary": salary,
             "vales": vales,
         },
@@ -56,58 +226,92 @@ async def read_root(request: Request, db: Session = Depends(get_db)):
 async def update_corrente(balance: float = Form(...), db: Session = Depends(get_db)):
     corrente = db.query(Account).filter_by(type="corrente").first()
     if corrente:
-        corrente.balance = balance
-        db.commit()
+        operations.set_account_balance(db, corrente.id, balance)
+        commit_changes(db)
     return RedirectResponse("/?tab=config", status_code=303)
 
 
 @app.post("/account/caixinha")
 async def add_caixinha(name: str = Form(...), balance: float = Form(0), db: Session = Depends(get_db)):
-    db.add(Account(name=name, type="caixinha", balance=balance))
-    db.commit()
+    operations.add_caixinha(db, name, balance)
+    commit_changes(db)
     return RedirectResponse("/?tab=config", status_code=303)
 
 
 @app.post("/account/caixinha/{account_id}")
 async def edit_caixinha(account_id: int, name: str = Form(...), balance: float = Form(...), db: Session = Depends(get_db)):
-    acc = db.query(Account).filter_by(id=account_id, type="caixinha").first()
-    if acc:
-        acc.name = name
-        acc.balance = balance
-        db.commit()
+    with suppress(operations.OperationError):
+        operations.update_caixinha(db, account_id, name, balance)
+        commit_changes(db)
     return RedirectResponse("/?tab=config", status_code=303)
 
 
+def parse_closing_day(value: str) -> int:
+    # Blank form field clears the closing day (0 is the "clear" sentinel).
+    try:
+        return int(value) if value.strip() else 0
+    except ValueError:
+        raise operations.OperationError("Dia de fechamento inválido.")
+
+
 @app.post("/credit-card")
 async def update_card(
     name: str = Form("Cartão de Crédito"),
     due_day: int = Form(10),
     open_amount: float = Form(0.0),
+    closing_day: str = Form(""),
     db: Session = Depends(get_db),
 ):
-    card = db.query(CreditCard).first()
-    card.name = name
-    card.due_day = due_day
-    card.open_amount = -abs(open_amount)
-    db.commit()
+    with suppress(operations.OperationError):
+        operations.update_card(db, name, due_day, open_amount, parse_closing_day(closing_day))
+        commit_changes(db)
+    return RedirectResponse("/?tab=config", status_code=303)
+
+
+@app.post("/credit-cards")
+async def add_card(
+    name: str = Form(...),
+    due_day: int = Form(10),
+    open_amount: float = Form(0.0),
+    closing_day: str = Form(""),
+    db: Session = Depends(get_db),
+):
+    with suppress(operations.OperationError):
+        operations.add_card(db, name, due_day, open_amount, parse_closing_day(closing_day))
+        commit_changes(db)
+    return RedirectResponse("/?tab=config", status_code=303)
+
+
+@app.post("/credit-card/{card_id}")
+async def edit_card(
+    card_id: int,
+    name: str = Form("Cartão de Crédito"),
+    due_day: int = Form(10),
+    open_amount: float = Form(0.0),
+    closing_day: str = Form(""),
+    db: Session = Depends(get_db),
+):
+    with suppress(operations.OperationError):
+        operations.update_card(db, name, due_day, open_amount, parse_closing_day(closing_day), card_id)
+        commit_changes(db)
     return RedirectResponse("/?tab=config", status_code=303)
 
 
 @app.post("/salary")
 async def update_salary(amount: float = Form(...), payday: int = Form(...), db: Session = Depends(get_db)):
-    salary = db.query(Salary).first()
-    salary.amount = amount
-    salary.payday = payday
-    db.commit()
+    with suppress(operations.OperationError):
+        operations.update_salary(db, amount, payday)
+        commit_changes(db)
     return RedirectResponse("/?tab=config", status_code=303)
 
 
 @app.get("/simulate")
 async def show_simulation(request: Request, days: int = 60, db: Session = Depends(get_db)):
     today = date.today()
-    rows, event_log = simulate(db, today, days)
+    rows, event_log = cached_simulation(db, today, days)
     accounts = db.query(Account).all()
-    vales = db.query(ValeBalance).all()
+    vales = db.query(ValeBalance).order_by(ValeBalance.id).all()
+    cards = db.query(CreditCard).order_by(CreditCard.id).all()
     transactions = db.query(Transaction).order_by(Transaction.date, Transaction.id).all()
     transfers = db.query(Transfer).order_by(Transfer.date, Transfer.id).all()
     account_lookup = {acc.id: acc.name for acc in accounts}
@@ -121,6 +325,7 @@ async def show_simulation(request: Request, days: int = 60, db: Session = Depend
             txn.amount,
             txn.target_type,
             txn.account_id,
+            txn.credit_card_id,
         )
         simulation_groups.append(
             {
@@ -130,6 +335,7 @@ async def show_simulation(request: Request, days: int = 60, db: Session = Depend
                 "amount": txn.amount,
                 "target_type": txn.target_type,
                 "account_id": txn.account_id,
+                "credit_card_id": txn.credit_card_id,
                 "dates": [txn.date],
                 "ids": [txn.id],
             }
@@ -183,6 +389,9 @@ async def show_simulation(request: Request, days: int = 60, db: Session = Depend
             "days": days,
             "accounts": accounts,
             "vales": vales,
+            "cards": cards,
+            "card_lookup": {card.id: card.name for card in cards},
+            "vale_lookup": {vale.vale_type: vale.label or vale.vale_type for vale in vales},
             "transactions": transactions,
             "transfers": transfers,
             "simulation_groups": ordered_groups,
@@ -201,39 +410,28 @@ async def add_transaction(
     transaction_type: str = Form("debit"),
     target_type: str = Form(...),
     account_id: int = Form(None),
+    credit_card_id: int = Form(None),
     db: Session = Depends(get_db),
 ):
     signed_amount = amount if transaction_type == "credit" else -amount
     dates = expand_date_ranges(date_start, date_end or [])
-    for txn_date in dates:
-        txn = Transaction(
-            description=description,
-            amount=signed_amount,
-            date=txn_date,
-            target_type=target_type,
-            account_id=account_id if target_type == "account" else None,
-        )
-        db.add(txn)
-    db.commit()
+    with suppress(operations.OperationError):
+        operations.add_transactions(db, description, signed_amount, dates, target_type, account_id, credit_card_id)
+        commit_changes(db)
     return RedirectResponse("/simulate", status_code=303)
 
 
 @app.post("/transactions/{transaction_id}/delete")
 async def delete_transaction(transaction_id: int, db: Session = Depends(get_db)):
-    txn = db.query(Transaction).filter_by(id=transaction_id).first()
-    if txn:
-        db.delete(txn)
-        db.commit()
+    if operations.delete_transactions(db, [transaction_id]):
+        commit_changes(db)
     return RedirectResponse("/simulate", status_code=303)
 
 
 @app.post("/transactions/bulk-delete")
 async def bulk_delete_transactions(transaction_ids: List[int] = Form(...), db: Session = Depends(get_db)):
-    for transaction_id in transaction_ids:
-        txn = db.query(Transaction).filter_by(id=transaction_id).first()
-        if txn:
-            db.delete(txn)
-    db.commit()
+    operations.delete_transactions(db, transaction_ids)
+    commit_changes(db)
     return RedirectResponse("/simulate", status_code=303)
 
 
@@ -247,39 +445,24 @@ async def add_transfer(
     to_account_id: int = Form(...),
     db: Session = Depends(get_db),
 ):
-    if from_account_id == to_account_id:
-        return RedirectResponse("/simulate", status_code=303)
-
     dates = expand_date_ranges(date_start, date_end or [])
-    for transfer_date in dates:
-        transfer = Transfer(
-            description=description,
-            amount=amount,
-            date=transfer_date,
-            from_account_id=from_account_id,
-            to_account_id=to_account_id,
-        )
-        db.add(transfer)
-    db.commit()
+    with suppress(operations.OperationError):
+        operations.add_transfers(db, description, amount, dates, from_account_id, to_account_id)
+        commit_changes(db)
     return RedirectResponse("/simulate", status_code=303)
 
 
 @app.post("/transfers/{transfer_id}/delete")
 async def delete_transfer(transfer_id: int, db: Session = Depends(get_db)):
-    transfer = db.query(Transfer).filter_by(id=transfer_id).first()
-    if transfer:
-        db.delete(transfer)
-        db.commit()
+    if operations.delete_transfers(db, [transfer_id]):
+        commit_changes(db)
     return RedirectResponse("/simulate", status_code=303)
 
 
 @app.post("/transfers/bulk-delete")
 async def bulk_delete_transfers(transfer_ids: List[int] = Form(...), db: Session = Depends(get_db)):
-    for transfer_id in transfer_ids:
-        transfer = db.query(Transfer).filter_by(id=transfer_id).first()
-        if transfer:
-            db.delete(transfer)
-    db.commit()
+    operations.delete_transfers(db, transfer_ids)
+    commit_changes(db)
     return RedirectResponse("/simulate", status_code=303)
 
 
@@ -287,27 +470,37 @@ async def bulk_delete_transfers(transfer_ids: List[int] = Form(...), db: Session
 async def clear_simulations(db: Session = Depends(get_db)):
     db.query(Transaction).delete()
     db.query(Transfer).delete()
-    db.commit()
+    commit_changes(db)
     return RedirectResponse("/simulate", status_code=303)
 
 
-@app.post("/vales/{vale_type}")
-async def update_vale(vale_type: str, balance: float = Form(...), db: Session = Depends(get_db)):
-    vale = db.query(ValeBalance).filter_by(vale_type=vale_type).first()
-    if vale:
-        vale.balance = balance
-        db.commit()
+@app.post("/vales")
+async def add_vale(
+    label: str = Form(...),
+    monthly_credit: float = Form(0.0),
+    balance: float = Form(0.0),
+    db: Session = Depends(get_db),
+):
+    with suppress(operations.OperationError):
+        operations.add_vale(db, label, monthly_credit, balance)
+        commit_changes(db)
     return RedirectResponse("/?tab=config", status_code=303)
 
 
-@app.get("/dashboard")
-async def dashboard(
-    request: Request,
-    start_date: Optional[str] = None,
-    end_date: Optional[str] = None,
-    account_ids: Optional[List[int]] = Query(None),
+@app.post("/vales/{vale_type}")
+async def update_vale(
+    vale_type: str,
+    balance: float = Form(...),
+    monthly_credit: str = Form(""),
     db: Session = Depends(get_db),
 ):
+    with suppress(operations.OperationError, ValueError):
+        operations.set_vale_balance(db, vale_type, balance, optional_number(monthly_credit))
+        commit_changes(db)
+    return RedirectResponse("/?tab=config", status_code=303)
+
+
+def dashboard_window(start_date: Optional[str], end_date: Optional[str]):
     base_date = date.today()
     if start_date:
         try:
@@ -340,220 +533,369 @@ async def dashboard(
     if requested_span > 365:
         validation_notes.append("Limitamos a janela a 365 dias a partir do início.")
     end_dt = base_date + timedelta(days=days - 1)
-
-    rows, _ = simulate(db, base_date, days)
-    accounts = db.query(Account).all()
-    vale_labels = {
-        "vale_refeicao": "Vale Refeição",
-        "vale_alimentacao": "Vale Alimentação",
+    return base_date, end_dt, days, validation_notes
+
+
+def summarize(name: str, values: List[float]) -> dict:
+    latest = values[-1] if values else 0.0
+    first = values[0] if values else None
+    return {
+        "name": name,
+        "latest": latest,
+        "prev": first,
+        "delta": latest - first if first is not None else None,
+        "delta_pct": ((latest - first) / abs(first) * 100) if first not in (None, 0) else None,
     }
 
-    selected_accounts = set(account_ids) if account_ids else {acc.id for acc in accounts}
 
-    labels = [row["date"].strftime("%d/%m") for row in rows]
-    account_series = []
-    vale_series = []
-
-    for acc in accounts:
-        balances = [row["accounts"].get(acc.id, 0.0) for row in rows]
-        final_value = balances[-1] if balances else 0.0
-        changes = []
-        for current in balances:
-            if current == 0:
-                changes.append(None)
-            else:
-                changes.append(((final_value - current) / abs(current)) * 100)
-        account_series.append({
-            "id": acc.id,
-            "name": acc.name,
-            "balances": balances,
-            "changes": changes,
-        })
+def series_names(db: Session) -> dict:
+    names = {f"account:{acc.id}": acc.name for acc in db.query(Account).all()}
+    for vale in db.query(ValeBalance).all():
+        names[f"vale:{vale.vale_type}"] = vale.label or vale.vale_type.replace("_", " ").title()
+    names["total"] = "Total (sem vales)"
+    names["vale_total"] = "Total vales"
+    return names
 
-    vale_keys = rows[0]["vales"].keys() if rows else []
-    for key in vale_keys:
-        balances = [row["vales"].get(key, 0.0) for row in rows]
-        latest = balances[-1] if balances else 0.0
-        first = balances[0] if balances else None
-        delta = latest - first if first is not None else None
-        delta_pct = ((latest - first) / abs(first) * 100) if first not in (None, 0) else None
-
-        changes = []
-        start_changes = []
-        for current in balances:
-            if current == 0:
-                changes.append(None)
-            else:
-                changes.append(((latest - current) / abs(current)) * 100)
-
-            if first in (None, 0):
-                start_changes.append(None)
-            else:
-                start_changes.append(((current - first) / abs(first)) * 100)
-
-        vale_series.append(
-            {
-                "id": key,
-                "name": vale_labels.get(key, key.replace("_", " ").title()),
-                "balances": balances,
-                "delta": delta,
-                "delta_pct": delta_pct,
-                "latest": latest,
-                "prev": first,
-                "changes": changes,
-                "start_changes": start_changes,
-            }
-        )
-
-    total_values = []
-    for row in rows:
-        total_values.append(sum(row["accounts"].values()) + row["credit_card"])
-
-    total_prev = total_values[0] if total_values else None
-    total_final = total_values[-1] if total_values else 0.0
-    total_changes = []
-    total_start_changes = []
-    total_daily_changes = []
-    prev_total_value = None
-    for current in total_values:
-        if current == 0:
-            total_changes.append(None)
-        else:
-            total_changes.append(((total_final - current) / abs(current)) * 100)
-
-        if total_prev in (None, 0):
-            total_start_changes.append(None)
-        else:
-            total_start_changes.append(((current - total_prev) / abs(total_prev)) * 100)
 
-        if prev_total_value in (None, 0):
-            total_daily_changes.append(None)
-        else:
-            total_daily_changes.append(((current - prev_total_value) / abs(prev_total_value)) * 100)
-        prev_total_value = current
-
-    summary_cards = []
-    for series in account_series:
-        latest = series["balances"][-1] if series["balances"] else 0.0
-        first = series["balances"][0] if series["balances"] else None
-        delta = latest - first if first is not None else None
-        delta_pct = ((latest - first) / abs(first) * 100) if first not in (None, 0) else None
-        summary_cards.append(
-            {
-                "name": series["name"],
-                "latest": latest,
-                "prev": first,
-                "delta": delta,
-                "delta_pct": delta_pct,
-            }
-        )
+@app.get("/dashboard")
+async def dashboard(
+    request: Request,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    account_ids: Optional[List[int]] = Query(None),
+    db: Session = Depends(get_db),
+):
+    live_version = live_for(db.info["household"]).version
+    base_date, end_dt, days, validation_notes = dashboard_window(start_date, end_date)
+    tomorrow = date.today() + timedelta(days=1)
 
-    total_delta = total_values[-1] - total_prev if total_prev is not None else None
-    total_delta_pct = ((total_values[-1] - total_prev) / abs(total_prev) * 100) if total_prev not in (None, 0) else None
+    rows, _ = cached_simulation(db, base_date, days)
+    accounts = db.query(Account).all()
+    names = series_names(db)
 
+    selected_accounts = set(account_ids) if account_ids else {acc.id for acc in accounts}
     selected_account_ids = list(selected_accounts)
 
+    summary_cards = [
+        summarize(acc.name, [row["accounts"].get(acc.id, 0.0) for row in rows]) for acc in accounts
+    ]
+    total_values = [sum(row["accounts"].values()) + row["credit_card"] for row in rows]
     total_vale_values = [sum(row["vales"].values()) for row in rows]
-    total_vale_prev = total_vale_values[0] if total_vale_values else None
-    total_vale_final = total_vale_values[-1] if total_vale_values else 0.0
-    total_vale_delta = total_vale_final - total_vale_prev if total_vale_prev is not None else None
-    total_vale_delta_pct = (
-        (total_vale_final - total_vale_prev) / abs(total_vale_prev) * 100
-        if total_vale_prev not in (None, 0)
-        else None
-    )
 
-    total_vale_changes = []
-    total_vale_start_changes = []
-    total_vale_daily_changes = []
-    prev_vale_value = None
-    for current in total_vale_values:
-        if current == 0:
-            total_vale_changes.append(None)
-        else:
-            total_vale_changes.append(((total_vale_final - current) / abs(current)) * 100)
-
-        if total_vale_prev in (None, 0):
-            total_vale_start_changes.append(None)
-        else:
-            total_vale_start_changes.append(((current - total_vale_prev) / abs(total_vale_prev)) * 100)
-
-        if prev_vale_value in (None, 0):
-            total_vale_daily_changes.append(None)
-        else:
-            total_vale_daily_changes.append(((current - prev_vale_value) / abs(prev_vale_value)) * 100)
-        prev_vale_value = current
-
-    vale_summary_cards = [
-        {
-            "name": "Total dos vales",
-            "latest": total_vale_values[-1] if total_vale_values else 0.0,
-            "prev": total_vale_prev,
-            "delta": total_vale_delta,
-            "delta_pct": total_vale_delta_pct,
-        }
-    ]
-    for series in vale_series:
+    vale_summary_cards = [summarize("Total dos vales", total_vale_values)]
+    vale_keys = rows[0]["vales"].keys() if rows else []
+    for key in vale_keys:
         vale_summary_cards.append(
-            {
-                "name": series["name"],
-                "latest": series["latest"],
-                "prev": series["prev"],
-                "delta": series["delta"],
-                "delta_pct": series["delta_pct"],
-            }
+            summarize(names.get(f"vale:{key}", key), [row["vales"].get(key, 0.0) for row in rows])
         )
 
-    chart_payload = {
-        "labels": labels,
-        "accounts": account_series,
-        "total": {
-            "values": total_values,
-            "changes": total_changes,
-            "start_changes": total_start_changes,
-            "daily_changes": total_daily_changes,
-        },
-        "vales": {
-            "series": vale_series,
-            "total": {
-                "values": total_vale_values,
-                "changes": total_vale_changes,
-                "start_changes": total_vale_start_changes,
-                "daily_changes": total_vale_daily_changes,
-            },
-        },
-    }
+    scenarios, comparison = await scenario_comparison_for(db, base_date, days)
+    cards = db.query(CreditCard).order_by(CreditCard.id).all()
 
     return templates.TemplateResponse(
         "dashboard.html",
         {
             "request": request,
-            "chart_data": json.dumps(chart_payload),
+            "chart_url": f"/api/dashboard/chart?start_date={base_date.isoformat()}&end_date={end_dt.isoformat()}",
             "summary_cards": summary_cards,
-            "total_summary": {
-                "latest": total_values[-1] if total_values else 0.0,
-                "prev": total_prev,
-                "delta": total_delta,
-                "delta_pct": total_delta_pct,
-            },
+            "total_summary": summarize("Total", total_values),
             "accounts": accounts,
             "selected_account_ids": selected_account_ids,
             "selected_accounts_json": json.dumps(selected_account_ids),
             "vale_summary_cards": vale_summary_cards,
-            "vale_total_summary": {
-                "latest": total_vale_values[-1] if total_vale_values else 0.0,
-                "prev": total_vale_prev,
-                "delta": total_vale_delta,
-                "delta_pct": total_vale_delta_pct,
-            },
+            "vale_total_summary": summarize("Total dos vales", total_vale_values),
             "start_date": base_date.isoformat(),
             "end_date": end_dt.isoformat(),
             "min_end_date": tomorrow.isoformat(),
             "validation_message": " ".join(validation_notes) if validation_notes else None,
+            "live_stream_url": f"/dashboard/stream?start_date={base_date.isoformat()}&days={days}&version={live_version}",
+            "scenarios": scenarios,
+            "scenario_results": comparison["scenarios"] if comparison else {},
+            "scenario_chart": scenario_chart(scenarios, comparison),
+            "cards": cards,
+            "card_lookup": {card.id: card.name for card in cards},
+            "vales": db.query(ValeBalance).order_by(ValeBalance.id).all(),
+            "names": names,
+            "scenario_window": f"{base_date.isoformat()},{end_dt.isoformat()}",
         },
     )
 
 
+def scenario_chart(scenarios, comparison) -> Optional[dict]:
+    if not comparison:
+        return None
+    return {
+        "labels": comparison["labels"],
+        "series": [{"name": "Atual", "values": comparison["base_totals"]}]
+        + [{"name": sc.name, "values": comparison["scenarios"][sc.id]["totals"]} for sc in scenarios],
+    }
+
+
+@app.get("/api/dashboard/chart")
+async def dashboard_chart(
+    request: Request,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    account_ids: Optional[List[int]] = Query(None),
+    points: Optional[int] = Query(None, ge=3, le=365),
+    db: Session = Depends(get_db),
+):
+    base_date, _, days, _ = dashboard_window(start_date, end_date)
+    # The projection only changes through mutations or when the day rolls
+    # over, so clients can revalidate without a recompute. Mutations are
+    # counted by the live channel, which unlike the warmer (dropped with an
+    # evicted shard) is never reset.
+    household = db.info["household"]
+    fingerprint = f"{BOOT_TOKEN}:{household}:{live_for(household).version}:{date.today()}:{base_date}:{days}:{sorted(account_ids or [])}:{points}"
+    etag = 'W/"' + hashlib.sha1(fingerprint.encode()).hexdigest()[:20] + '"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Accept-Encoding"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    rows, _ = cached_simulation(db, base_date, days)
+    hidden = None
+    if account_ids:
+        hidden = {f"account:{acc.id}" for acc in db.query(Account).all() if acc.id not in set(account_ids)}
+    payload = compact_chart(rows, series_names(db), hidden, points)
+    body, encoding = encode_json(payload, request.headers.get("accept-encoding", ""))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def dashboard_series(household: str, start_date: date, days: int):
+    db = shards.session(household)
+    try:
+        rows, _ = cached_simulation(db, start_date, days)
+        return base_series(rows)
+    finally:
+        db.close()
+
+
+@app.get("/dashboard/stream")
+async def dashboard_stream(
+    request: Request,
+    start_date: date,
+    days: int = Query(30, ge=1, le=365),
+    version: int = -1,
+    household: str = Depends(get_household),
+):
+    compute = partial(dashboard_series, household)
+    return StreamingResponse(
+        live_for(household).stream(start_date, days, version, compute, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def scenario_redirect(window: str) -> RedirectResponse:
+    # window is "<start>,<end>" so the dashboard reopens on the same range.
+    start, _, end = window.partition(",")
+    try:
+        query = f"?start_date={date.fromisoformat(start)}&end_date={date.fromisoformat(end)}"
+    except ValueError:
+        query = ""
+    return RedirectResponse(f"/dashboard{query}#cenarios", status_code=303)
+
+
+def optional_number(value: str, cast=float):
+    return cast(value) if value.strip() else None
+
+
+@app.post("/scenarios")
+async def add_scenario(name: str = Form(...), window: str = Form(""), db: Session = Depends(get_db)):
+    with suppress(operations.OperationError):
+        operations.add_scenario(db, name)
+        db.commit()
+    return scenario_redirect(window)
+
+
+@app.post("/scenarios/{scenario_id}/delete")
+async def delete_scenario(scenario_id: int, window: str = Form(""), db: Session = Depends(get_db)):
+    if operations.delete_scenario(db, scenario_id):
+        db.commit()
+    return scenario_redirect(window)
+
+
+@app.post("/scenarios/{scenario_id}/changes")
+async def add_scenario_change(
+    scenario_id: int,
+    kind: str = Form(...),
+    description: str = Form(""),
+    amount: str = Form(""),
+    transaction_type: str = Form("debit"),
+    date_start: List[str] = Form(...),
+    date_end: List[str] = Form(None),
+    target_type: str = Form("account"),
+    account_id: str = Form(""),
+    to_account_id: str = Form(""),
+    credit_card_id: str = Form(""),
+    day: str = Form(""),
+    window: str = Form(""),
+    db: Session = Depends(get_db),
+):
+    value = optional_number(amount)
+    if kind == "transaction" and value is not None and transaction_type != "credit":
+        value = -value
+    dates = expand_date_ranges(date_start, date_end or [])
+    if kind in ("salary", "card_due_day"):
+        dates = dates[:1]  # recurring changes apply from this day on
+    with suppress(operations.OperationError, ValueError):
+        operations.add_scenario_changes(
+            db,
+            scenario_id,
+            kind,
+            dates,
+            description.strip() or None,
+            value,
+            target_type,
+            optional_number(account_id, int),
+            optional_number(to_account_id, int),
+            optional_number(credit_card_id, int),
+            optional_number(day, int),
+        )
+        db.commit()
+    return scenario_redirect(window)
+
+
+@app.post("/scenarios/{scenario_id}/changes/{change_id}/delete")
+async def delete_scenario_change(
+    scenario_id: int, change_id: int, window: str = Form(""), db: Session = Depends(get_db)
+):
+    if operations.delete_scenario_change(db, scenario_id, change_id):
+        db.commit()
+    return scenario_redirect(window)
+
+
+@app.get("/api/scenarios")
+async def scenario_comparison(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    base_date, _, days, _ = dashboard_window(start_date, end_date)
+    scenarios, comparison = await scenario_comparison_for(db, base_date, days)
+    names = {sc.id: sc.name for sc in scenarios}
+    scenarios = comparison["scenarios"] if comparison else {}
+    return jsonable_encoder(
+        {
+            "start_date": base_date,
+            "days": days,
+            "base_totals": comparison["base_totals"] if comparison else [],
+            "scenarios": [dict(result, id=scenario_id, name=names[scenario_id]) for scenario_id, result in scenarios.items()],
+        }
+    )
+
+
 @app.post("/simulate/days")
 async def update_days(days: int = Form(60)):
     return RedirectResponse(f"/simulate?days={days}", status_code=303)
+
+
+@app.post("/api/batch")
+async def apply_batch(batch: BatchRequest, db: Session = Depends(get_db)):
+    for index, operation in enumerate(batch.operations):
+        try:
+            operations.apply_operation(db, operation)
+        except operations.OperationError as exc:
+            db.rollback()
+            raise HTTPException(
+                status_code=400,
+                detail={"index": index, "op": operation.op, "message": str(exc)},
+            )
+    commit_changes(db)
+
+    response = {"applied": len(batch.operations)}
+    if batch.include_projection:
+        today = date.today()
+        rows, event_log = cached_simulation(db, today, batch.days)
+        response["projection"] = {
+            "start_date": today,
+            "days": batch.days,
+            "rows": rows,
+            "events": [
+                {"date": day, "description": description, "amount": amount, "target": target}
+                for day, description, amount, target in event_log
+            ],
+        }
+    return jsonable_encoder(response)
+
+
+@app.get("/api/precompute")
+async def precompute_status(household: str = Depends(get_household)):
+    return warmer_for(household).status()
+
+
+@app.get("/api/history")
+async def history(
+    target: str,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    granularity: str = Query("month", pattern="^(day|month|year)$"),
+    db: Session = Depends(get_db),
+):
+    end_dt = end_date or date.today()
+    if granularity == "day":
+        # Daily points come from raw snapshots, so the span is capped.
+        base_date = start_date or end_dt - timedelta(days=MAX_DAILY_HISTORY_DAYS - 1)
+        if (end_dt - base_date).days + 1 > MAX_DAILY_HISTORY_DAYS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"O histórico diário é limitado a {MAX_DAILY_HISTORY_DAYS} dias; use month ou year.",
+            )
+    else:
+        base_date = start_date or end_dt.replace(year=end_dt.year - 1, day=1)
+    return {
+        "target": target,
+        "granularity": granularity,
+        "points": balance_history(db, target, base_date, end_dt, granularity),
+    }
+
+
+def export_window(start_date: Optional[date], end_date: Optional[date]):
+    base_date = start_date or date.today()
+    end_dt = end_date or base_date + timedelta(days=59)
+    if end_dt < base_date:
+        raise HTTPException(status_code=400, detail="A data final precisa ser igual ou posterior à data inicial.")
+    days = (end_dt - base_date).days + 1
+    if days > MAX_EXPORT_DAYS:
+        raise HTTPException(status_code=400, detail=f"A exportação é limitada a {MAX_EXPORT_DAYS} dias.")
+    return base_date, days
+
+
+@app.get("/export/projection.csv")
+async def export_projection(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    account_ids: Optional[List[int]] = Query(None),
+    compress: bool = False,
+    db: Session = Depends(get_db),
+):
+    base_date, days = export_window(start_date, end_date)
+    steps = iter_simulation(db, base_date, days)
+    accounts = db.query(Account).all()
+    vale_labels = {vale.vale_type: vale.label for vale in db.query(ValeBalance).all() if vale.label}
+    selected = set(account_ids) if account_ids else None
+    return StreamingResponse(
+        stream_csv(projection_rows(steps, accounts, vale_labels, selected), compress),
+        media_type="application/gzip" if compress else "text/csv; charset=utf-8",
+        headers=download_headers(f"projecao_{base_date.isoformat()}_{days}d.csv", compress),
+    )
+
+
+@app.get("/export/events.csv")
+async def export_events(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    account_ids: Optional[List[int]] = Query(None),
+    compress: bool = False,
+    db: Session = Depends(get_db),
+):
+    base_date, days = export_window(start_date, end_date)
+    steps = iter_simulation(db, base_date, days)
+    selected = set(account_ids) if account_ids else None
+    return StreamingResponse(
+        stream_csv(event_rows(steps, selected), compress),
+        media_type="application/gzip" if compress else "text/csv; charset=utf-8",
+        headers=download_headers(f"eventos_{base_date.isoformat()}_{days}d.csv", compress),
+    )
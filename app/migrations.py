@@ -0,0 +1,32 @@
+from .db import Base
+from . import models  # noqa: F401 - registers every table on Base.metadata
+
+
+def add_column(conn, table: str, column: str, ddl: str) -> None:
+    existing = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+    if column not in existing:
+        conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+
+def multiple_cards_and_vales(conn) -> None:
+    add_column(conn, "credit_cards", "closing_day", "INTEGER")
+    add_column(conn, "vale_balances", "label", "VARCHAR")
+    add_column(conn, "vale_balances", "monthly_credit", "FLOAT")
+    add_column(conn, "transactions", "credit_card_id", "INTEGER REFERENCES credit_cards(id)")
+
+
+# Applied in order and tracked through SQLite's PRAGMA user_version. Steps must
+# be idempotent: fresh databases already get the new columns from create_all.
+MIGRATIONS = [
+    multiple_cards_and_vales,
+]
+
+
+def run_migrations(engine) -> int:
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        version = conn.exec_driver_sql("PRAGMA user_version").scalar() or 0
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            migration(conn)
+            conn.exec_driver_sql(f"PRAGMA user_version = {number}")
+    return len(MIGRATIONS)
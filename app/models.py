@@ -1,5 +1,5 @@
 from datetime import date
-from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, UniqueConstraint
 from sqlalchemy.orm import relationship
 
 from .db import Base
@@ -27,6 +27,7 @@ class CreditCard(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, default="Cartão de Crédito")
     due_day = Column(Integer, default=1)
+    closing_day = Column(Integer, nullable=True)  # None: the whole open amount is paid on the due day
     open_amount = Column(Float, default=0.0)
 
 
@@ -42,7 +43,9 @@ class ValeBalance(Base):
     __tablename__ = "vale_balances"
 
     id = Column(Integer, primary_key=True, index=True)
-    vale_type = Column(String, unique=True, nullable=False)  # refeicao or alimentacao
+    vale_type = Column(String, unique=True, nullable=False)  # e.g. vale_refeicao, vale_alimentacao
+    label = Column(String, nullable=True)
+    monthly_credit = Column(Float, nullable=True)  # credited on the penultimate business day
     balance = Column(Float, default=0.0)
 
 
@@ -53,8 +56,9 @@ class Transaction(Base):
     description = Column(String, nullable=False)
     amount = Column(Float, nullable=False)
     date = Column(Date, nullable=False)
-    target_type = Column(String, nullable=False)  # account, credit_card, vale_refeicao, vale_alimentacao
+    target_type = Column(String, nullable=False)  # account, credit_card or a vale_type
     account_id = Column(Integer, ForeignKey("accounts.id"), nullable=True)
+    credit_card_id = Column(Integer, ForeignKey("credit_cards.id"), nullable=True)  # None: first card
 
     account = relationship("Account")
 
@@ -82,3 +86,69 @@ class FutureEvent(Base):
     amount = Column(Float, nullable=False)
     target = Column(String, nullable=False)
     source = Column(String, default="default")
+
+
+class BalanceSnapshot(Base):
+    __tablename__ = "balance_snapshots"
+
+    id = Column(Integer, primary_key=True, index=True)
+    target = Column(String, nullable=False, index=True)  # account:<id>, vale:<type> or credit_card:<id>
+    day = Column(Date, nullable=False, index=True)
+    balance = Column(Float, nullable=False)
+    recorded_at = Column(DateTime, nullable=False)
+
+
+class BalanceRollup(Base):
+    __tablename__ = "balance_rollups"
+    __table_args__ = (UniqueConstraint("target", "period", "period_start"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    target = Column(String, nullable=False)
+    period = Column(String, nullable=False)  # month or year
+    period_start = Column(Date, nullable=False)
+    first_balance = Column(Float, nullable=False)
+    last_balance = Column(Float, nullable=False)
+    min_balance = Column(Float, nullable=False)
+    max_balance = Column(Float, nullable=False)
+    balance_sum = Column(Float, default=0.0)
+    samples = Column(Integer, default=0)
+
+
+class HouseholdAccess(Base):
+    # Only the hash of the household's access token is stored.
+    __tablename__ = "household_access"
+
+    id = Column(Integer, primary_key=True, index=True)
+    token_hash = Column(String, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+
+
+class Scenario(Base):
+    __tablename__ = "scenarios"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+
+    changes = relationship(
+        "ScenarioChange", back_populates="scenario", cascade="all, delete-orphan", order_by="ScenarioChange.id"
+    )
+
+
+class ScenarioChange(Base):
+    # Overlay applied on top of the real data; nothing here touches the ledger.
+    __tablename__ = "scenario_changes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    scenario_id = Column(Integer, ForeignKey("scenarios.id"), nullable=False, index=True)
+    kind = Column(String, nullable=False)  # transaction, transfer, salary or card_due_day
+    description = Column(String, nullable=True)
+    amount = Column(Float, nullable=True)
+    date = Column(Date, nullable=False)  # event date, or first day a salary/due day change applies
+    target_type = Column(String, nullable=True)
+    account_id = Column(Integer, nullable=True)
+    to_account_id = Column(Integer, nullable=True)
+    credit_card_id = Column(Integer, nullable=True)
+    day = Column(Integer, nullable=True)  # new payday or due day
+
+    scenario = relationship("Scenario", back_populates="changes")
@@ -0,0 +1,320 @@
+import re
+import unicodedata
+from datetime import date, datetime
+from typing import Iterable, List, Optional
+
+from .history import record_balance
+from .models import Account, CreditCard, Salary, Scenario, ScenarioChange, Transaction, Transfer, ValeBalance
+
+# Mutations shared by the HTML forms and the JSON batch API. None of them
+# commit: the caller decides the transaction boundary.
+
+
+class OperationError(ValueError):
+    pass
+
+
+def set_account_balance(db_session, account_id: int, balance: float) -> Account:
+    acc = db_session.query(Account).filter_by(id=account_id).first()
+    if not acc:
+        raise OperationError(f"Conta {account_id} não encontrada.")
+    acc.balance = balance
+    record_balance(db_session, f"account:{acc.id}", balance)
+    return acc
+
+
+def add_caixinha(db_session, name: str, balance: float) -> Account:
+    acc = Account(name=name, type="caixinha", balance=balance)
+    db_session.add(acc)
+    db_session.flush()
+    record_balance(db_session, f"account:{acc.id}", balance)
+    return acc
+
+
+def update_caixinha(db_session, account_id: int, name: str, balance: float) -> Account:
+    acc = db_session.query(Account).filter_by(id=account_id, type="caixinha").first()
+    if not acc:
+        raise OperationError(f"Caixinha {account_id} não encontrada.")
+    acc.name = name
+    return set_account_balance(db_session, acc.id, balance)
+
+
+def check_day(day: int, label: str) -> None:
+    # Recurring days are capped at 28 so they exist in every month.
+    if not 1 <= day <= 28:
+        raise OperationError(f"{label} precisa estar entre 1 e 28.")
+
+
+def add_card(
+    db_session, name: str, due_day: int, open_amount: float = 0.0, closing_day: Optional[int] = None
+) -> CreditCard:
+    check_day(due_day, "O dia de vencimento")
+    if closing_day:
+        check_day(closing_day, "O dia de fechamento")
+    card = CreditCard(name=name, due_day=due_day, closing_day=closing_day or None, open_amount=-abs(open_amount))
+    db_session.add(card)
+    db_session.flush()
+    record_balance(db_session, f"credit_card:{card.id}", card.open_amount)
+    return card
+
+
+def update_card(
+    db_session,
+    name: Optional[str] = None,
+    due_day: Optional[int] = None,
+    open_amount: Optional[float] = None,
+    closing_day: Optional[int] = None,
+    card_id: Optional[int] = None,
+) -> CreditCard:
+    query = db_session.query(CreditCard)
+    card = query.filter_by(id=card_id).first() if card_id is not None else query.order_by(CreditCard.id).first()
+    if not card:
+        raise OperationError("Cartão de crédito não encontrado.")
+    if due_day is not None:
+        check_day(due_day, "O dia de vencimento")
+    if closing_day:
+        check_day(closing_day, "O dia de fechamento")
+    if name is not None:
+        card.name = name
+    if due_day is not None:
+        card.due_day = due_day
+    if closing_day is not None:
+        card.closing_day = closing_day or None  # 0 clears the closing day
+    if open_amount is not None:
+        card.open_amount = -abs(open_amount)
+        record_balance(db_session, f"credit_card:{card.id}", card.open_amount)
+    return card
+
+
+def update_salary(db_session, amount: Optional[float] = None, payday: Optional[int] = None) -> Salary:
+    salary = db_session.query(Salary).first()
+    if not salary:
+        raise OperationError("Salário não configurado.")
+    if payday is not None:
+        check_day(payday, "O dia do pagamento")
+    if amount is not None:
+        salary.amount = amount
+    if payday is not None:
+        salary.payday = payday
+    return salary
+
+
+def vale_key(label: str) -> str:
+    slug = re.sub(r"[^a-z0-9]+", "_", unicodedata.normalize("NFKD", label).encode("ascii", "ignore").decode().lower())
+    slug = slug.strip("_")
+    return slug if slug.startswith("vale_") else f"vale_{slug}"
+
+
+def add_vale(db_session, label: str, monthly_credit: float = 0.0, balance: float = 0.0) -> ValeBalance:
+    vale_type = vale_key(label)
+    if vale_type == "vale_":
+        raise OperationError("Informe um nome válido para o vale.")
+    if db_session.query(ValeBalance).filter_by(vale_type=vale_type).first():
+        raise OperationError(f"Vale {vale_type} já existe.")
+    vale = ValeBalance(vale_type=vale_type, label=label, monthly_credit=monthly_credit, balance=balance)
+    db_session.add(vale)
+    record_balance(db_session, f"vale:{vale_type}", balance)
+    return vale
+
+
+def set_vale_balance(
+    db_session, vale_type: str, balance: float, monthly_credit: Optional[float] = None
+) -> ValeBalance:
+    vale = db_session.query(ValeBalance).filter_by(vale_type=vale_type).first()
+    if not vale:
+        raise OperationError(f"Vale {vale_type} não encontrado.")
+    if monthly_credit is not None:
+        vale.monthly_credit = monthly_credit
+    vale.balance = balance
+    record_balance(db_session, f"vale:{vale.vale_type}", balance)
+    return vale
+
+
+def check_transaction_target(
+    db_session, target_type: str, account_id: Optional[int], credit_card_id: Optional[int]
+) -> None:
+    if target_type == "account" and not db_session.query(Account).filter_by(id=account_id).first():
+        raise OperationError(f"Conta {account_id} não encontrada.")
+    if target_type == "credit_card" and credit_card_id is not None:
+        if not db_session.query(CreditCard).filter_by(id=credit_card_id).first():
+            raise OperationError(f"Cartão {credit_card_id} não encontrado.")
+    if target_type not in ("account", "credit_card"):
+        if not db_session.query(ValeBalance).filter_by(vale_type=target_type).first():
+            raise OperationError(f"Destino {target_type} desconhecido.")
+
+
+def add_transactions(
+    db_session,
+    description: str,
+    amount: float,
+    dates: Iterable[date],
+    target_type: str,
+    account_id: Optional[int] = None,
+    credit_card_id: Optional[int] = None,
+) -> List[Transaction]:
+    check_transaction_target(db_session, target_type, account_id, credit_card_id)
+    transactions = [
+        Transaction(
+            description=description,
+            amount=amount,
+            date=txn_date,
+            target_type=target_type,
+            account_id=account_id if target_type == "account" else None,
+            credit_card_id=credit_card_id if target_type == "credit_card" else None,
+        )
+        for txn_date in dates
+    ]
+    db_session.add_all(transactions)
+    return transactions
+
+
+def delete_transactions(db_session, transaction_ids: Iterable[int]) -> int:
+    deleted = 0
+    for transaction_id in transaction_ids:
+        txn = db_session.query(Transaction).filter_by(id=transaction_id).first()
+        if txn:
+            db_session.delete(txn)
+            deleted += 1
+    return deleted
+
+
+def check_transfer_accounts(db_session, from_account_id: Optional[int], to_account_id: Optional[int]) -> None:
+    if from_account_id == to_account_id:
+        raise OperationError("Origem e destino da transferência precisam ser diferentes.")
+    for account_id in (from_account_id, to_account_id):
+        if not db_session.query(Account).filter_by(id=account_id).first():
+            raise OperationError(f"Conta {account_id} não encontrada.")
+
+
+def add_transfers(
+    db_session,
+    description: str,
+    amount: float,
+    dates: Iterable[date],
+    from_account_id: int,
+    to_account_id: int,
+) -> List[Transfer]:
+    check_transfer_accounts(db_session, from_account_id, to_account_id)
+    transfers = [
+        Transfer(
+            description=description,
+            amount=amount,
+            date=transfer_date,
+            from_account_id=from_account_id,
+            to_account_id=to_account_id,
+        )
+        for transfer_date in dates
+    ]
+    db_session.add_all(transfers)
+    return transfers
+
+
+def delete_transfers(db_session, transfer_ids: Iterable[int]) -> int:
+    deleted = 0
+    for transfer_id in transfer_ids:
+        transfer = db_session.query(Transfer).filter_by(id=transfer_id).first()
+        if transfer:
+            db_session.delete(transfer)
+            deleted += 1
+    return deleted
+
+
+def add_scenario(db_session, name: str) -> Scenario:
+    if not name.strip():
+        raise OperationError("Informe um nome para o cenário.")
+    scenario = Scenario(name=name.strip(), created_at=datetime.now())
+    db_session.add(scenario)
+    return scenario
+
+
+def delete_scenario(db_session, scenario_id: int) -> bool:
+    scenario = db_session.query(Scenario).filter_by(id=scenario_id).first()
+    if scenario:
+        db_session.delete(scenario)
+    return scenario is not None
+
+
+def add_scenario_changes(
+    db_session,
+    scenario_id: int,
+    kind: str,
+    dates: Iterable[date],
+    description: Optional[str] = None,
+    amount: Optional[float] = None,
+    target_type: Optional[str] = None,
+    account_id: Optional[int] = None,
+    to_account_id: Optional[int] = None,
+    credit_card_id: Optional[int] = None,
+    day: Optional[int] = None,
+) -> List[ScenarioChange]:
+    scenario = db_session.query(Scenario).filter_by(id=scenario_id).first()
+    if not scenario:
+        raise OperationError(f"Cenário {scenario_id} não encontrado.")
+    dates = list(dates)
+    if not dates:
+        raise OperationError("Informe ao menos uma data.")
+    if kind == "transaction":
+        if amount is None or not description:
+            raise OperationError("Transações precisam de descrição e valor.")
+        check_transaction_target(db_session, target_type, account_id, credit_card_id)
+    elif kind == "transfer":
+        if amount is None or not description:
+            raise OperationError("Transferências precisam de descrição e valor.")
+        check_transfer_accounts(db_session, account_id, to_account_id)
+    elif kind == "salary":
+        if amount is None and day is None:
+            raise OperationError("Informe o novo valor ou o novo dia do salário.")
+    elif kind == "card_due_day":
+        if day is None:
+            raise OperationError("Informe o novo dia de vencimento.")
+        if credit_card_id is not None and not db_session.query(CreditCard).filter_by(id=credit_card_id).first():
+            raise OperationError(f"Cartão {credit_card_id} não encontrado.")
+    else:
+        raise OperationError(f"Tipo de alteração {kind} desconhecido.")
+    if day is not None:
+        check_day(day, "O dia")
+
+    changes = [
+        ScenarioChange(
+            scenario_id=scenario.id,
+            kind=kind,
+            description=description,
+            amount=amount,
+            date=change_date,
+            target_type=target_type if kind == "transaction" else None,
+            account_id=account_id if kind in ("transaction", "transfer") else None,
+            to_account_id=to_account_id if kind == "transfer" else None,
+            credit_card_id=credit_card_id if kind in ("transaction", "card_due_day") else None,
+            day=day if kind in ("salary", "card_due_day") else None,
+        )
+        for change_date in dates
+    ]
+    db_session.add_all(changes)
+    return changes
+
+
+def delete_scenario_change(db_session, scenario_id: int, change_id: int) -> bool:
+    change = db_session.query(ScenarioChange).filter_by(id=change_id, scenario_id=scenario_id).first()
+    if change:
+        db_session.delete(change)
+    return change is not None
+
+
+def apply_operation(db_session, operation) -> None:
+    handlers = {
+        "set_balance": lambda op: set_account_balance(db_session, op.account_id, op.balance),
+        "add_transaction": lambda op: add_transactions(
+            db_session, op.description, op.amount, op.dates, op.target_type, op.account_id, op.credit_card_id
+        ),
+        "delete_transaction": lambda op: delete_transactions(db_session, op.ids),
+        "add_transfer": lambda op: add_transfers(
+            db_session, op.description, op.amount, op.dates, op.from_account_id, op.to_account_id
+        ),
+        "delete_transfer": lambda op: delete_transfers(db_session, op.ids),
+        "update_salary": lambda op: update_salary(db_session, op.amount, op.payday),
+        "update_card": lambda op: update_card(
+            db_session, op.name, op.due_day, op.open_amount, op.closing_day, op.card_id
+        ),
+        "update_vale": lambda op: set_vale_balance(db_session, op.vale_type, op.balance, op.monthly_credit),
+    }
+    handlers[operation.op](operation)
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from contextlib import suppress
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+from .history import record_daily_snapshots
+from .simulation import ensure_defaults, simulate
+
+logger = logging.getLogger(__name__)
+
+# Windows rendered by /simulate (60 days) and /dashboard (30 days) by default.
+DEFAULT_WINDOWS = (60, 30)
+DEBOUNCE_SECONDS = 1.0
+MAX_BASE_RUNS = 8
+
+
+def seconds_until_midnight(now: Optional[datetime] = None) -> float:
+    now = now or datetime.now()
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return max((midnight - now).total_seconds(), 0.0)
+
+
+class ProjectionWarmer:
+    def __init__(self, session_factory, windows: Iterable[int] = DEFAULT_WINDOWS, debounce: float = DEBOUNCE_SECONDS):
+        self._session_factory = session_factory
+        self.windows = tuple(windows)
+        self.debounce = debounce
+        self.generation = 0
+        self.refreshed_at: Optional[datetime] = None
+        self._results: Dict[Tuple[date, int], tuple] = {}
+        self._base_runs: "OrderedDict[Tuple[date, date, int], object]" = OrderedDict()
+        self._dirty: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def get(self, start_date: date, days: int):
+        return self._results.get((start_date, days))
+
+    def store(self, generation: int, start_date: date, days: int, result) -> None:
+        # Results computed before the latest mutation are stale and dropped.
+        if generation == self.generation and days in self.windows and start_date == date.today():
+            self._results[(start_date, days)] = result
+            self.refreshed_at = datetime.now()
+
+    def get_base_run(self, start_date: date, days: int):
+        return self._base_runs.get((date.today(), start_date, days))
+
+    def store_base_run(self, generation: int, start_date: date, days: int, base_run) -> None:
+        # Scenario comparisons fork from these; any window is accepted, so
+        # only the most recent few are kept.
+        if generation != self.generation:
+            return
+        self._base_runs[(date.today(), start_date, days)] = base_run
+        while len(self._base_runs) > MAX_BASE_RUNS:
+            self._base_runs.popitem(last=False)
+
+    def invalidate(self) -> None:
+        self.generation += 1
+        self._results.clear()
+        self._base_runs.clear()
+        if self._dirty is not None:
+            self._dirty.set()
+
+    def status(self) -> dict:
+        today = date.today()
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "refreshed_at": self.refreshed_at.isoformat() if self.refreshed_at else None,
+            "generation": self.generation,
+            "windows": {days: (today, days) in self._results for days in self.windows},
+        }
+
+    @property
+    def started(self) -> bool:
+        return self._task is not None
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._dirty = asyncio.Event()
+        self._dirty.set()
+        self._task = self._loop.create_task(self._run())
+
+    def cancel(self) -> None:
+        # Safe to call from worker threads (e.g. when a shard is evicted).
+        if self._task is not None:
+            self._loop.call_soon_threadsafe(self._task.cancel)
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._dirty.wait(), seconds_until_midnight() + 1)
+                await self._settle()
+            except asyncio.TimeoutError:
+                pass  # day rolled over: yesterday's windows no longer match date.today()
+            self._dirty.clear()
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Falha ao pré-calcular projeções")
+
+    async def _settle(self) -> None:
+        # Debounce bursts of mutations into a single recompute.
+        while True:
+            self._dirty.clear()
+            try:
+                await asyncio.wait_for(self._dirty.wait(), self.debounce)
+            except asyncio.TimeoutError:
+                return
+
+    async def refresh(self) -> None:
+        generation = self.generation
+        today = date.today()
+        self._results = {key: value for key, value in self._results.items() if key[0] == today}
+        missing = [days for days in self.windows if (today, days) not in self._results]
+        if not missing:
+            return
+        results = await asyncio.to_thread(self._compute, today, missing)
+        for days, result in results.items():
+            self.store(generation, today, days, result)
+
+    def _compute(self, today: date, windows) -> Dict[int, tuple]:
+        db = self._session_factory()
+        try:
+            ensure_defaults(db)
+            if record_daily_snapshots(db, today):
+                db.commit()
+            return {days: simulate(db, today, days) for days in windows}
+        finally:
+            db.close()
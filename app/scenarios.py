@@ -0,0 +1,153 @@
+import asyncio
+from datetime import date, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from .models import Salary, Scenario
+from .simulation import build_timeline, run_timeline
+from .targets import ResolvedEvent, TargetRegistry
+from .utils import monthly_business_days
+
+SCENARIO_KINDS = ("transaction", "transfer", "salary", "card_due_day")
+SALARY_TARGET = "account:corrente"
+
+Timeline = Dict[date, List[ResolvedEvent]]
+
+
+class Change(NamedTuple):
+    kind: str
+    description: Optional[str]
+    amount: Optional[float]
+    date: date
+    target_type: Optional[str]
+    account_id: Optional[int]
+    to_account_id: Optional[int]
+    credit_card_id: Optional[int]
+    day: Optional[int]
+
+    @classmethod
+    def from_row(cls, row) -> "Change":
+        return cls(*(getattr(row, field) for field in cls._fields))
+
+
+class BaseRun(NamedTuple):
+    registry: TargetRegistry
+    timeline: Timeline
+    start_date: date
+    days: int
+    rows: List[dict]
+    checkpoints: List[List[float]]  # raw balances at the start of each day
+    salary: Tuple[float, int]
+
+
+def run_base(db_session, start_date: date, days: int) -> BaseRun:
+    registry, timeline = build_timeline(db_session, start_date, days)
+    checkpoints: List[List[float]] = []
+    rows = [row for row, _ in run_timeline(registry, timeline, start_date, days, checkpoints=checkpoints)]
+    salary = db_session.query(Salary).first()
+    return BaseRun(registry, timeline, start_date, max(days, 1), rows, checkpoints, (salary.amount, salary.payday))
+
+
+def overlay_timeline(base: BaseRun, changes: List[Change]) -> Tuple[Timeline, Optional[date]]:
+    # Copy-on-write: untouched days keep pointing at the base event lists.
+    registry = base.registry
+    end_date = base.start_date + timedelta(days=base.days - 1)
+    timeline = dict(base.timeline)
+    touched = set()
+
+    def edit(day: date) -> List[ResolvedEvent]:
+        touched.add(day)
+        if day not in timeline or timeline[day] is base.timeline.get(day):
+            timeline[day] = list(base.timeline.get(day, ()))
+        return timeline[day]
+
+    def replace_recurring(label: str, since: date, dates: List[date], event: ResolvedEvent) -> None:
+        for day, events in list(timeline.items()):
+            if day >= since and any(evt.label == label for evt in events):
+                kept = [evt for evt in events if evt.label != label]
+                edit(day)[:] = kept
+        for day in dates:
+            edit(day).append(event)
+
+    for change in changes:
+        since = max(change.date, base.start_date)
+        if change.kind == "transaction" and base.start_date <= change.date <= end_date:
+            edit(change.date).append(
+                registry.resolve_transaction(
+                    change.description, change.amount, change.target_type, change.account_id, change.credit_card_id
+                )
+            )
+        elif change.kind == "transfer" and base.start_date <= change.date <= end_date:
+            edit(change.date).extend(
+                registry.resolve_transfer(change.description, change.amount, change.account_id, change.to_account_id)
+            )
+        elif change.kind == "salary":
+            amount = base.salary[0] if change.amount is None else change.amount
+            payday = change.day or base.salary[1]
+            event = registry.resolve_default("Salário", amount, SALARY_TARGET)
+            replace_recurring(SALARY_TARGET, since, monthly_business_days(since, end_date, payday), event)
+        elif change.kind == "card_due_day":
+            card_id = registry.card_id(change.credit_card_id)
+            if card_id is None or not change.day:
+                continue
+            label = f"credit_card:pay:{card_id}"
+            description = next(
+                (evt.description for events in base.timeline.values() for evt in events if evt.label == label),
+                "Pagamento fatura",
+            )
+            event = registry.resolve_default(description, -1.0, label)
+            replace_recurring(label, since, monthly_business_days(since, end_date, change.day), event)
+
+    diverged = [day for day in touched if timeline.get(day, []) != base.timeline.get(day, [])]
+    return timeline, min(diverged) if diverged else None
+
+
+def row_total(row: dict) -> float:
+    return sum(row["accounts"].values()) + row["credit_card"]
+
+
+def changed_balances(base: dict, current: dict) -> dict:
+    return {key: value - base.get(key, 0.0) for key, value in current.items() if abs(value - base.get(key, 0.0)) >= 0.005}
+
+
+def fork(base: BaseRun, changes: List[Change]) -> dict:
+    # Days before the first divergent one are shared with the base run; the
+    # scenario resumes from the base balances checkpointed at that day.
+    timeline, diverges_on = overlay_timeline(base, changes)
+    rows = base.rows
+    computed_days = 0
+    if diverges_on is not None:
+        offset = (diverges_on - base.start_date).days
+        computed_days = base.days - offset
+        suffix = run_timeline(
+            base.registry, timeline, diverges_on, computed_days, balances=base.checkpoints[offset]
+        )
+        rows = base.rows[:offset] + [row for row, _ in suffix]
+
+    base_totals = [row_total(row) for row in base.rows]
+    totals = [row_total(row) for row in rows]
+    lowest = min(range(len(totals)), key=totals.__getitem__)
+    base_lowest = min(range(len(base_totals)), key=base_totals.__getitem__)
+    return {
+        "diverges_on": diverges_on,
+        "computed_days": computed_days,
+        "totals": [round(value, 2) for value in totals],
+        "final": totals[-1],
+        "final_delta": totals[-1] - base_totals[-1],
+        "lowest": totals[lowest],
+        "lowest_date": rows[lowest]["date"],
+        "lowest_delta": totals[lowest] - base_totals[base_lowest],
+        "accounts": changed_balances(base.rows[-1]["accounts"], rows[-1]["accounts"]),
+        "vales": changed_balances(base.rows[-1]["vales"], rows[-1]["vales"]),
+        "cards": changed_balances(base.rows[-1]["credit_cards"], rows[-1]["credit_cards"]),
+    }
+
+
+async def compare_scenarios(scenarios: List[Scenario], base: BaseRun) -> dict:
+    # The base timeline is shared read-only by every fork.
+    overlays = [[Change.from_row(change) for change in scenario.changes] for scenario in scenarios]
+    results = await asyncio.gather(*(asyncio.to_thread(fork, base, changes) for changes in overlays))
+    return {
+        "labels": [row["date"].isoformat() for row in base.rows],
+        "base_totals": [round(row_total(row), 2) for row in base.rows],
+        "scenarios": {scenario.id: result for scenario, result in zip(scenarios, results)},
+    }
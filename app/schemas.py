@@ -0,0 +1,82 @@
+from datetime import date
+from typing import Annotated, List, Literal, Optional, Union
+
+from pydantic import BaseModel, Field
+
+
+class SetBalanceOp(BaseModel):
+    op: Literal["set_balance"]
+    account_id: int
+    balance: float
+
+
+class AddTransactionOp(BaseModel):
+    op: Literal["add_transaction"]
+    description: str
+    amount: float  # signed: negative for debits, positive for credits
+    dates: List[date] = Field(min_length=1)
+    target_type: str  # account, credit_card or a vale_type
+    account_id: Optional[int] = None
+    credit_card_id: Optional[int] = None
+
+
+class DeleteTransactionOp(BaseModel):
+    op: Literal["delete_transaction"]
+    ids: List[int]
+
+
+class AddTransferOp(BaseModel):
+    op: Literal["add_transfer"]
+    description: str
+    amount: float
+    dates: List[date] = Field(min_length=1)
+    from_account_id: int
+    to_account_id: int
+
+
+class DeleteTransferOp(BaseModel):
+    op: Literal["delete_transfer"]
+    ids: List[int]
+
+
+class UpdateSalaryOp(BaseModel):
+    op: Literal["update_salary"]
+    amount: Optional[float] = None
+    payday: Optional[int] = Field(None, ge=1, le=28)
+
+
+class UpdateCardOp(BaseModel):
+    op: Literal["update_card"]
+    card_id: Optional[int] = None  # defaults to the first card
+    name: Optional[str] = None
+    due_day: Optional[int] = Field(None, ge=1, le=28)
+    closing_day: Optional[int] = Field(None, ge=0, le=28)  # 0 clears it
+    open_amount: Optional[float] = None
+
+
+class UpdateValeOp(BaseModel):
+    op: Literal["update_vale"]
+    vale_type: str
+    balance: float
+    monthly_credit: Optional[float] = None
+
+
+BatchOperation = Annotated[
+    Union[
+        SetBalanceOp,
+        AddTransactionOp,
+        DeleteTransactionOp,
+        AddTransferOp,
+        DeleteTransferOp,
+        UpdateSalaryOp,
+        UpdateCardOp,
+        UpdateValeOp,
+    ],
+    Field(discriminator="op"),
+]
+
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation] = Field(min_length=1)
+    include_projection: bool = False
+    days: int = Field(60, ge=1, le=365)
@@ -1,5 +1,5 @@
 from datetime import date, timedelta
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 from .models import (
     Account,
@@ -10,30 +10,48 @@ from .models import (
     Transfer,
     ValeBalance,
 )
+from .targets import OP_ADD, SPECIAL_HANDLERS, ResolvedEvent, TargetRegistry
 from .utils import adjust_to_previous_business_day, penultimate_business_day, daterange
 
 VALE_REFEICAO_VALUE = 1236.40
 VALE_ALIMENTACAO_VALUE = 974.16
 
+DEFAULT_VALES = {
+    "vale_refeicao": ("Vale Refeição", VALE_REFEICAO_VALUE),
+    "vale_alimentacao": ("Vale Alimentação", VALE_ALIMENTACAO_VALUE),
+}
+
 
 def ensure_defaults(db_session):
     if not db_session.query(Account).filter_by(type="corrente").first():
         db_session.add(Account(name="Conta Corrente", type="corrente", balance=0.0))
-    card = db_session.query(CreditCard).first()
-    if not card:
+    cards = db_session.query(CreditCard).all()
+    if not cards:
         db_session.add(CreditCard(name="Cartão de Crédito", due_day=10, open_amount=0.0))
-    elif card.open_amount > 0:
-        card.open_amount = -abs(card.open_amount)
+    for card in cards:
+        if card.open_amount and card.open_amount > 0:
+            card.open_amount = -abs(card.open_amount)
     if not db_session.query(Salary).first():
         db_session.add(Salary(amount=0.0, payday=5))
-    for vale_type in ["vale_refeicao", "vale_alimentacao"]:
-        if not db_session.query(ValeBalance).filter_by(vale_type=vale_type).first():
-            db_session.add(ValeBalance(vale_type=vale_type, balance=0.0))
+    for vale_type, (label, monthly_credit) in DEFAULT_VALES.items():
+        vale = db_session.query(ValeBalance).filter_by(vale_type=vale_type).first()
+        if not vale:
+            db_session.add(
+                ValeBalance(vale_type=vale_type, label=label, monthly_credit=monthly_credit, balance=0.0)
+            )
+        elif vale.label is None or vale.monthly_credit is None:
+            vale.label = vale.label or label
+            vale.monthly_credit = monthly_credit if vale.monthly_credit is None else vale.monthly_credit
     db_session.commit()
 
 
 def sync_default_events(
-    db_session, start_date: date, days: int, salary: Salary, credit_card: CreditCard
+    db_session,
+    start_date: date,
+    days: int,
+    salary: Salary,
+    credit_cards: List[CreditCard],
+    vales: List[ValeBalance],
 ):
     effective_days = max(days, 1)
     end_date = start_date + timedelta(days=effective_days - 1)
@@ -62,35 +80,44 @@ def sync_default_events(
 
         penultimate = penultimate_business_day(current.year, current.month)
         if start_date <= penultimate <= end_date:
-            events.append(
-                FutureEvent(
-                    date=penultimate,
-                    description="Crédito Vale Refeição",
-                    amount=VALE_REFEICAO_VALUE,
-                    target="vale:vale_refeicao",
-                )
-            )
-            events.append(
-                FutureEvent(
-                    date=penultimate,
-                    description="Crédito Vale Alimentação",
-                    amount=VALE_ALIMENTACAO_VALUE,
-                    target="vale:vale_alimentacao",
+            for vale in vales:
+                if not vale.monthly_credit:
+                    continue
+                events.append(
+                    FutureEvent(
+                        date=penultimate,
+                        description=f"Crédito {vale.label or vale.vale_type}",
+                        amount=vale.monthly_credit,
+                        target=f"vale:{vale.vale_type}",
+                    )
                 )
-            )
 
-        due_day = adjust_to_previous_business_day(
-            date(current.year, current.month, credit_card.due_day)
-        )
-        if start_date <= due_day <= end_date:
-            events.append(
-                FutureEvent(
-                    date=due_day,
-                    description="Pagamento fatura",
-                    amount=-1.0,
-                    target="credit_card:pay",
-                )
+        for card in credit_cards:
+            suffix = f" ({card.name})" if len(credit_cards) > 1 else ""
+            if card.closing_day:
+                closing_date = date(current.year, current.month, card.closing_day)
+                if start_date <= closing_date <= end_date:
+                    events.append(
+                        FutureEvent(
+                            date=closing_date,
+                            description=f"Fechamento fatura{suffix}",
+                            amount=0.0,
+                            target=f"credit_card:close:{card.id}",
+                        )
+                    )
+
+            due_day = adjust_to_previous_business_day(
+                date(current.year, current.month, card.due_day)
             )
+            if start_date <= due_day <= end_date:
+                events.append(
+                    FutureEvent(
+                        date=due_day,
+                        description=f"Pagamento fatura{suffix}",
+                        amount=-1.0,
+                        target=f"credit_card:pay:{card.id}",
+                    )
+                )
 
         if current.month == 12:
             current = date(current.year + 1, 1, 1)
@@ -102,91 +129,95 @@ def sync_default_events(
     db_session.commit()
 
 
-def simulate(db_session, start_date: date, days: int):
-    accounts = db_session.query(Account).all()
+def build_timeline(db_session, start_date: date, days: int):
     salary = db_session.query(Salary).first()
-    credit_card = db_session.query(CreditCard).first()
-    vale_ref = db_session.query(ValeBalance).filter_by(vale_type="vale_refeicao").first()
-    vale_alim = db_session.query(ValeBalance).filter_by(vale_type="vale_alimentacao").first()
+    credit_cards = db_session.query(CreditCard).order_by(CreditCard.id).all()
+    vales = db_session.query(ValeBalance).order_by(ValeBalance.id).all()
+    sync_default_events(db_session, start_date, days, salary, credit_cards, vales)
 
-    account_balances = {acc.id: acc.balance for acc in accounts}
-    vale_balances = {
-        "vale_refeicao": vale_ref.balance if vale_ref else 0.0,
-        "vale_alimentacao": vale_alim.balance if vale_alim else 0.0,
-    }
-    card_balance = -abs(credit_card.open_amount) if credit_card else 0.0
-
-    sync_default_events(db_session, start_date, days, salary, credit_card)
+    registry = TargetRegistry(db_session.query(Account).all(), vales, credit_cards)
 
     effective_days = max(days, 1)
     end_date = start_date + timedelta(days=effective_days - 1)
+    timeline: Dict[date, List[ResolvedEvent]] = {}
+
+    # Same order as the ledger has always been applied in: default events,
+    # then transactions, then transfers, each in insertion order.
     default_events = (
         db_session.query(FutureEvent)
         .filter(FutureEvent.date >= start_date, FutureEvent.date <= end_date)
         .order_by(FutureEvent.date, FutureEvent.id)
         .all()
     )
-
-    events_by_day: Dict[date, List[FutureEvent]] = {}
     for evt in default_events:
-        events_by_day.setdefault(evt.date, []).append(evt)
+        timeline.setdefault(evt.date, []).append(
+            registry.resolve_default(evt.description, evt.amount, evt.target)
+        )
 
-    transactions = db_session.query(Transaction).all()
-    transfers = db_session.query(Transfer).all()
+    transactions = (
+        db_session.query(Transaction)
+        .filter(Transaction.date >= start_date, Transaction.date <= end_date)
+        .order_by(Transaction.id)
+        .all()
+    )
+    for txn in transactions:
+        timeline.setdefault(txn.date, []).append(
+            registry.resolve_transaction(
+                txn.description, txn.amount, txn.target_type, txn.account_id, txn.credit_card_id
+            )
+        )
 
-    rows = []
-    event_log: List[Tuple[date, str, float, str]] = []
+    transfers = (
+        db_session.query(Transfer)
+        .filter(Transfer.date >= start_date, Transfer.date <= end_date)
+        .order_by(Transfer.id)
+        .all()
+    )
+    for mov in transfers:
+        timeline.setdefault(mov.date, []).extend(
+            registry.resolve_transfer(mov.description, mov.amount, mov.from_account_id, mov.to_account_id)
+        )
 
-    for day in daterange(start_date, effective_days):
-        for evt in events_by_day.get(day, []):
-            actual_amount = evt.amount
-            if evt.target == "account:corrente":
-                corrente = next((acc for acc in accounts if acc.type == "corrente"), None)
-                if corrente:
-                    account_balances[corrente.id] += evt.amount
-            elif evt.target.startswith("vale:"):
-                vale_key = evt.target.split(":")[1]
-                vale_balances[vale_key] += evt.amount
-            elif evt.target == "credit_card:pay":
-                corrente = next((acc for acc in accounts if acc.type == "corrente"), None)
-                if corrente and card_balance != 0:
-                    payment = abs(card_balance)
-                    account_balances[corrente.id] -= payment
-                    actual_amount = -payment
-                    card_balance = 0.0
-                else:
-                    actual_amount = 0.0
-            event_log.append((day, evt.description, actual_amount, evt.target))
-
-        for txn in [t for t in transactions if t.date == day]:
-            if txn.target_type == "account" and txn.account_id:
-                account_balances[txn.account_id] += txn.amount
-            elif txn.target_type == "credit_card":
-                card_balance += txn.amount
-            elif txn.target_type == "vale_refeicao":
-                vale_balances["vale_refeicao"] += txn.amount
-            elif txn.target_type == "vale_alimentacao":
-                vale_balances["vale_alimentacao"] += txn.amount
-            event_log.append((day, txn.description, txn.amount, f"txn:{txn.target_type}"))
-
-        for mov in [m for m in transfers if m.date == day]:
-            if mov.from_account_id in account_balances and mov.to_account_id in account_balances:
-                account_balances[mov.from_account_id] -= mov.amount
-                account_balances[mov.to_account_id] += mov.amount
-                event_log.append(
-                    (day, mov.description, -mov.amount, f"transfer:from:{mov.from_account_id}")
-                )
-                event_log.append(
-                    (day, mov.description, mov.amount, f"transfer:to:{mov.to_account_id}")
-                )
+    return registry, timeline
 
-        rows.append(
-            {
-                "date": day,
-                "accounts": {acc.id: account_balances[acc.id] for acc in accounts},
-                "vales": dict(vale_balances),
-                "credit_card": card_balance,
-            }
-        )
 
+def run_timeline(
+    registry: TargetRegistry,
+    timeline: Dict[date, List[ResolvedEvent]],
+    start_date: date,
+    days: int,
+    balances: Optional[List[float]] = None,
+    checkpoints: Optional[List[List[float]]] = None,
+):
+    # checkpoints, when given, collects the raw balances at the start of each
+    # day so a later run can resume from any of them.
+    balances = list(registry.balances if balances is None else balances)
+    for day in daterange(start_date, max(days, 1)):
+        if checkpoints is not None:
+            checkpoints.append(list(balances))
+        day_events: List[Tuple[date, str, float, str, Optional[int]]] = []
+        for evt in timeline.get(day, ()):
+            if evt.op == OP_ADD:
+                if evt.slot is not None:
+                    balances[evt.slot] += evt.amount
+                actual_amount = evt.amount
+            else:
+                actual_amount = SPECIAL_HANDLERS[evt.op](balances, evt)
+            day_events.append((day, evt.description, actual_amount, evt.label, evt.account_id))
+        yield registry.snapshot(day, balances), day_events
+
+
+def iter_simulation(db_session, start_date: date, days: int):
+    # Everything is loaded and resolved up front, so the returned generator
+    # never touches the session and can outlive it (e.g. in a streaming response).
+    registry, timeline = build_timeline(db_session, start_date, days)
+    return run_timeline(registry, timeline, start_date, days)
+
+
+def simulate(db_session, start_date: date, days: int):
+    rows = []
+    event_log: List[Tuple[date, str, float, str]] = []
+    for row, day_events in iter_simulation(db_session, start_date, days):
+        rows.append(row)
+        event_log.extend(evt[:4] for evt in day_events)
     return rows, event_log
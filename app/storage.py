@@ -0,0 +1,200 @@
+import hashlib
+import hmac
+import os
+import re
+import secrets
+import sys
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from .db import DATABASE_URL
+from .migrations import run_migrations
+from .models import HouseholdAccess
+
+DEFAULT_HOUSEHOLD = "default"
+HOUSEHOLD_DATA_DIR = os.environ.get("HOUSEHOLD_DATA_DIR", "./households")
+MAX_OPEN_SHARDS = int(os.environ.get("MAX_OPEN_SHARDS", "32"))
+HOUSEHOLD_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")
+
+
+def valid_household(household: Optional[str]) -> bool:
+    return bool(household) and bool(HOUSEHOLD_PATTERN.match(household))
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def household_signature(secret: str, household: str, token_hash: str) -> str:
+    # Bound to the current token hash, so issuing a new token revokes old cookies.
+    return hmac.new(secret.encode("utf-8"), f"{household}:{token_hash}".encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+class UnknownHousehold(LookupError):
+    pass
+
+
+class Shard:
+    def __init__(self, household: str, url: str):
+        self.household = household
+        self.engine = create_engine(url, connect_args={"check_same_thread": False})
+        run_migrations(self.engine)
+        self.session_factory = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+
+
+class ShardManager:
+    # One SQLite file per household, so each household has its own write lock.
+    # Only the most recently used engines stay open.
+    def __init__(
+        self,
+        default_url: str = DATABASE_URL,
+        data_dir: str = HOUSEHOLD_DATA_DIR,
+        max_open: int = MAX_OPEN_SHARDS,
+        on_evict: Optional[Callable[[str], None]] = None,
+    ):
+        self.default_url = default_url
+        self.data_dir = data_dir
+        self.max_open = max(1, max_open)
+        self.on_evict = on_evict
+        self._shards: "OrderedDict[str, Shard]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def url_for(self, household: str) -> str:
+        if household == DEFAULT_HOUSEHOLD:
+            return self.default_url
+        return f"sqlite:///{self.path_for(household)}"
+
+    def exists(self, household: str) -> bool:
+        if household == DEFAULT_HOUSEHOLD:
+            return True
+        return valid_household(household) and os.path.exists(self.path_for(household))
+
+    def path_for(self, household: str) -> str:
+        return os.path.join(self.data_dir, household + ".db")
+
+    def shard(self, household: str) -> Shard:
+        if not valid_household(household):
+            raise ValueError(f"Identificador de residência inválido: {household!r}")
+        with self._lock:
+            shard = self._shards.get(household)
+            if shard is not None:
+                self._shards.move_to_end(household)
+                return shard
+        if not self.exists(household):
+            raise UnknownHousehold(f"Residência {household} não encontrada.")
+
+        # Opening and migrating happens outside the lock so a slow shard never
+        # holds up session checkout for the other households.
+        opened = Shard(household, self.url_for(household))
+        evicted: List[Shard] = []
+        with self._lock:
+            shard = self._shards.get(household)
+            if shard is None:
+                shard = self._shards[household] = opened
+                while len(self._shards) > self.max_open:
+                    _, oldest = self._shards.popitem(last=False)
+                    evicted.append(oldest)
+            else:
+                self._shards.move_to_end(household)
+                evicted.append(opened)  # another thread won the race
+        for old in evicted:
+            # Sessions already checked out keep their connection until closed.
+            old.engine.dispose()
+            if self.on_evict and old is not opened:
+                self.on_evict(old.household)
+        return shard
+
+    def create(self, household: str) -> str:
+        if not valid_household(household):
+            raise ValueError(f"Identificador de residência inválido: {household!r}")
+        if self.exists(household) and household != DEFAULT_HOUSEHOLD:
+            raise ValueError(f"Residência {household} já existe.")
+        os.makedirs(self.data_dir, exist_ok=True)
+        # Creates and migrates the file; the manager opens it on first use.
+        Shard(household, self.url_for(household)).engine.dispose()
+        return self.issue_token(household)
+
+    def issue_token(self, household: str) -> str:
+        token = secrets.token_urlsafe(24)
+        db = self.session(household)
+        try:
+            db.query(HouseholdAccess).delete()
+            db.add(HouseholdAccess(token_hash=hash_token(token), created_at=datetime.now()))
+            db.commit()
+        finally:
+            db.close()
+        return token
+
+    def access_hash(self, household: str) -> Optional[str]:
+        # Read on every check so a token issued from the CLI takes effect at once.
+        if not self.exists(household):
+            return None
+        db = self.session(household)
+        try:
+            return db.query(HouseholdAccess.token_hash).order_by(HouseholdAccess.id.desc()).scalar()
+        finally:
+            db.close()
+
+    def check_token(self, household: str, token: str) -> bool:
+        expected = self.access_hash(household)
+        return expected is not None and hmac.compare_digest(expected, hash_token(token))
+
+    def session(self, household: str):
+        db = self.shard(household).session_factory()
+        db.info["household"] = household
+        return db
+
+    def open_households(self) -> List[str]:
+        with self._lock:
+            return list(self._shards)
+
+    def known_households(self) -> List[str]:
+        households = {DEFAULT_HOUSEHOLD}
+        if os.path.isdir(self.data_dir):
+            for name in os.listdir(self.data_dir):
+                stem, ext = os.path.splitext(name)
+                if ext == ".db" and valid_household(stem):
+                    households.add(stem)
+        return sorted(households)
+
+    def migrate_all(self) -> List[str]:
+        migrated = []
+        for household in self.known_households():
+            shard = Shard(household, self.url_for(household))
+            shard.engine.dispose()
+            migrated.append(household)
+        return migrated
+
+    def close_all(self) -> None:
+        with self._lock:
+            shards = list(self._shards.values())
+            self._shards.clear()
+        for shard in shards:
+            shard.engine.dispose()
+
+
+if __name__ == "__main__":
+    command, names = (sys.argv[1], sys.argv[2:]) if len(sys.argv) > 1 else ("", [])
+    manager = ShardManager()
+    if command == "migrate" and not names:
+        for name in manager.migrate_all():
+            print(f"migrado: {name}")
+    elif command in ("create", "token") and names:
+        # The token is shown only once; the shard keeps just its hash.
+        try:
+            for name in names:
+                token = manager.create(name) if command == "create" else manager.issue_token(name)
+                print(f"{name} {token}")
+        except (ValueError, UnknownHousehold) as exc:
+            sys.exit(f"erro: {exc}")
+        finally:
+            manager.close_all()
+    else:
+        sys.exit(
+            "uso: python -m app.storage migrate | create <id> [<id> ...] | token <id> [<id> ...]"
+        )
@@ -0,0 +1,145 @@
+from typing import Dict, List, NamedTuple, Optional
+
+# Event opcodes. Each event is resolved to integer slots once, before the
+# day loop, so applying it is a list index instead of string parsing.
+OP_ADD = 0
+OP_CARD_PAY = 1
+OP_CARD_CLOSE = 2
+
+
+class ResolvedEvent(NamedTuple):
+    op: int
+    slot: Optional[int]
+    amount: float
+    description: str
+    label: str
+    account_id: Optional[int] = None
+    statement: Optional[int] = None  # slot holding the closed bill of a card
+    payer: Optional[int] = None  # slot debited when a card bill is paid
+
+
+def pay_card(balances: List[float], evt: ResolvedEvent) -> float:
+    bill = balances[evt.statement] if evt.statement is not None else balances[evt.slot]
+    if evt.payer is None or bill == 0:
+        return 0.0
+    balances[evt.payer] -= abs(bill)
+    balances[evt.slot] -= bill
+    if evt.statement is not None:
+        balances[evt.statement] = 0.0
+    return -abs(bill)
+
+
+def close_card(balances: List[float], evt: ResolvedEvent) -> float:
+    # Closing only freezes the bill; no money moves, so it logs as zero.
+    balances[evt.statement] = balances[evt.slot]
+    return 0.0
+
+
+SPECIAL_HANDLERS = {
+    OP_CARD_PAY: pay_card,
+    OP_CARD_CLOSE: close_card,
+}
+
+
+class TargetRegistry:
+    def __init__(self, accounts, vales, cards):
+        self.balances: List[float] = []
+        self.account_slots: Dict[int, int] = {}
+        self.vale_slots: Dict[str, int] = {}
+        self.card_slots: Dict[int, int] = {}
+        self.statement_slots: Dict[int, int] = {}
+        self.corrente_slot: Optional[int] = None
+        self.corrente_id: Optional[int] = None
+
+        for acc in accounts:
+            self.account_slots[acc.id] = self._slot(acc.balance)
+            if acc.type == "corrente" and self.corrente_id is None:
+                self.corrente_id = acc.id
+                self.corrente_slot = self.account_slots[acc.id]
+        for vale in vales:
+            self.vale_slots[vale.vale_type] = self._slot(vale.balance)
+        for card in cards:
+            open_amount = -abs(card.open_amount or 0.0)
+            self.card_slots[card.id] = self._slot(open_amount)
+            if card.closing_day:
+                # What is already open when the simulation starts counts as
+                # the closed bill due on the next due date.
+                self.statement_slots[card.id] = self._slot(open_amount)
+        self.default_card_id = next(iter(self.card_slots), None)
+
+        self.account_items = list(self.account_slots.items())
+        self.vale_items = list(self.vale_slots.items())
+        self.card_items = list(self.card_slots.items())
+
+    def _slot(self, value: Optional[float]) -> int:
+        self.balances.append(value or 0.0)
+        return len(self.balances) - 1
+
+    def card_id(self, card_id: Optional[int]) -> Optional[int]:
+        return card_id if card_id in self.card_slots else self.default_card_id
+
+    def resolve_default(self, description: str, amount: float, target: str) -> ResolvedEvent:
+        kind, _, key = target.partition(":")
+        if kind == "account":
+            slot = self.corrente_slot if key == "corrente" else self.account_slots.get(int(key))
+            account_id = self.corrente_id if key == "corrente" else int(key)
+            return ResolvedEvent(OP_ADD, slot, amount, description, target, account_id if slot is not None else None)
+        if kind == "vale":
+            return ResolvedEvent(OP_ADD, self.vale_slots.get(key), amount, description, target)
+        if kind == "credit_card":
+            action, _, card_key = key.partition(":")
+            card_id = self.card_id(int(card_key) if card_key else None)
+            slot = self.card_slots.get(card_id)
+            statement = self.statement_slots.get(card_id)
+            if action == "close":
+                if statement is None:
+                    return ResolvedEvent(OP_ADD, None, 0.0, description, target)
+                return ResolvedEvent(OP_CARD_CLOSE, slot, amount, description, target, statement=statement)
+            if slot is None:
+                return ResolvedEvent(OP_ADD, None, 0.0, description, target)
+            return ResolvedEvent(
+                OP_CARD_PAY,
+                slot,
+                amount,
+                description,
+                target,
+                account_id=self.corrente_id,
+                statement=statement,
+                payer=self.corrente_slot,
+            )
+        return ResolvedEvent(OP_ADD, None, amount, description, target)
+
+    def resolve_transaction(
+        self,
+        description: str,
+        amount: float,
+        target_type: str,
+        account_id: Optional[int],
+        credit_card_id: Optional[int] = None,
+    ) -> ResolvedEvent:
+        label = f"txn:{target_type}"
+        if target_type == "account":
+            slot = self.account_slots.get(account_id) if account_id else None
+            return ResolvedEvent(OP_ADD, slot, amount, description, label, account_id)
+        if target_type == "credit_card":
+            slot = self.card_slots.get(self.card_id(credit_card_id))
+            return ResolvedEvent(OP_ADD, slot, amount, description, label)
+        return ResolvedEvent(OP_ADD, self.vale_slots.get(target_type), amount, description, label)
+
+    def resolve_transfer(self, description: str, amount: float, from_id: int, to_id: int) -> List[ResolvedEvent]:
+        if from_id not in self.account_slots or to_id not in self.account_slots:
+            return []
+        return [
+            ResolvedEvent(OP_ADD, self.account_slots[from_id], -amount, description, f"transfer:from:{from_id}", from_id),
+            ResolvedEvent(OP_ADD, self.account_slots[to_id], amount, description, f"transfer:to:{to_id}", to_id),
+        ]
+
+    def snapshot(self, day, balances: List[float]) -> dict:
+        cards = {card_id: balances[slot] for card_id, slot in self.card_items}
+        return {
+            "date": day,
+            "accounts": {acc_id: balances[slot] for acc_id, slot in self.account_items},
+            "vales": {vale_type: balances[slot] for vale_type, slot in self.vale_items},
+            "credit_card": sum(cards.values()),
+            "credit_cards": cards,
+        }
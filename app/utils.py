@@ -30,6 +30,17 @@ def penultimate_business_day(year: int, month: int) -> date:
     return business_days[-1]
 
 
+def monthly_business_days(start: date, end: date, day: int) -> List[date]:
+    dates: List[date] = []
+    current = start.replace(day=1)
+    while current <= end:
+        adjusted = adjust_to_previous_business_day(date(current.year, current.month, day))
+        if start <= adjusted <= end:
+            dates.append(adjusted)
+        current = date(current.year + 1, 1, 1) if current.month == 12 else date(current.year, current.month + 1, 1)
+    return dates
+
+
 def daterange(start: date, days: int):
     for offset in range(days):
         yield start + timedelta(days=offset)